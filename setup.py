@@ -113,6 +113,14 @@ setup(
             extra_compile_args=compiler_and_linker_args,
             extra_link_args=compiler_and_linker_args,
             language="c++"),
+        Extension(
+            name="natcap.invest.hydropower.hydropower_water_yield_core",
+            sources=[
+                'src/natcap/invest/hydropower/hydropower_water_yield_core.pyx'],
+            include_dirs=[numpy.get_include()],
+            extra_compile_args=compiler_and_linker_args,
+            extra_link_args=compiler_and_linker_args,
+            language="c++"),
         Extension(
             name="natcap.invest.ndr.ndr_core",
             sources=['src/natcap/invest/ndr/ndr_core.pyx'],
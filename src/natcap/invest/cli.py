@@ -274,14 +274,12 @@ def export_to_python(target_filepath, model, args_dict=None):
                          in args_dict.items())
 
     with codecs.open(target_filepath, 'w', encoding='utf-8') as py_file:
-        args = pprint.pformat(cast_args, indent=4)  # 4 spaces
-
-        # Tweak formatting from pprint:
-        # * Bump parameter inline with starting { to next line
-        # * add trailing comma to last item item pair
-        # * add extra space to spacing before first item
-        args = args.replace('{', '{\n ')
-        args = args.replace('}', ',\n}')
+        # One sorted key/value pair per line, indented 4 spaces, each with a
+        # trailing comma.  The items are written with repr() so that braces
+        # within string values are kept as they are.
+        args = '{\n%s}' % ''.join(
+            '    %r: %r,\n' % (key, value)
+            for key, value in sorted(cast_args.items()))
         py_file.write(script_template.format(
             invest_version=__version__,
             today=datetime.datetime.now().strftime('%c'),
@@ -287,12 +287,13 @@ def execute(args):
         unique_lucodes = numpy.unique(numpy.concatenate(
             (unique_lucodes, unique_block)))
 
-    missing_lucodes = set(crop_lucodes).difference(
-        set(unique_lucodes))
-    if len(missing_lucodes) > 0:
+    # setdiff1d returns the missing codes sorted numerically
+    missing_lucodes = numpy.setdiff1d(crop_lucodes, unique_lucodes)
+    if missing_lucodes.size > 0:
         LOGGER.warning(
             "The following lucodes are in the landcover to crop table but "
-            "aren't in the landcover raster: %s", missing_lucodes)
+            "aren't in the landcover raster: %s",
+            ', '.join(map(str, missing_lucodes)))
 
     LOGGER.info("Checking that crops correspond to known types.")
     for crop_name in crop_to_landcover_table:
@@ -1,8 +1,12 @@
 """InVEST Hydropower Water Yield model."""
+import collections
+import concurrent.futures
 import logging
 import os
-import math
+import multiprocessing
 import pickle
+import shutil
+import tempfile
 
 import numpy
 from osgeo import gdal
@@ -12,9 +16,16 @@ import taskgraph
 
 from .. import validation
 from .. import utils
+from . import hydropower_water_yield_core
 
 LOGGER = logging.getLogger(__name__)
 
+# Landcover codes below this are looked up in a dense array of key indexes.
+_MAX_DENSE_LUCODE = 2**16
+
+# GDAL block cache size (bytes) of each block worker process.
+_WORKER_GDAL_CACHEMAX = 64 * 2**20
+
 ARGS_SPEC = {
     "model_name": "Hydropower Water Yield",
     "module": __name__,
@@ -283,12 +294,16 @@ def execute(args):
         watershed_vector = gdal.OpenEx(
             args['watersheds_path'], gdal.OF_VECTOR)
         watershed_layer = watershed_vector.GetLayer()
-        missing_ws_ids = []
-        for watershed_feature in watershed_layer:
-            watershed_ws_id = watershed_feature.GetField('ws_id')
-            if watershed_ws_id not in valuation_params:
-                missing_ws_ids.append(watershed_ws_id)
-        watershed_feature = None
+        # Only the ws_id field is needed, so don't read geometries or any
+        # other attributes.
+        watershed_layer.SetIgnoredFields(
+            ['OGR_GEOMETRY', 'OGR_STYLE'] +
+            [field_defn.GetName() for field_defn in watershed_layer.schema
+             if field_defn.GetName().lower() != 'ws_id'])
+        watershed_ws_ids = set(
+            watershed_feature.GetField('ws_id')
+            for watershed_feature in watershed_layer)
+        missing_ws_ids = watershed_ws_ids.difference(valuation_params)
         watershed_layer = None
         watershed_vector = None
         if missing_ws_ids:
@@ -406,9 +421,9 @@ def execute(args):
     if 'demand_table_path' in args and args['demand_table_path'] != '':
         demand_dict = utils.build_lookup_from_csv(
             args['demand_table_path'], 'lucode')
-        demand_reclassify_dict = dict(
-            [(lucode, demand_dict[lucode]['demand'])
-             for lucode in demand_dict])
+        demand_reclassify_dict = {
+            lucode: demand_row['demand']
+            for lucode, demand_row in demand_dict.items()}
         demand_lucodes = set(demand_dict.keys())
         demand_lucodes.add(nodata_dict['lulc'])
         LOGGER.debug('demand_lucodes %s', demand_lucodes)
@@ -445,106 +460,46 @@ def execute(args):
         else:
             root_dict[lulc_code] = 1.0
 
+    # The fractp (then wyield) and demand tasks can run at the same time in
+    # TaskGraph's worker processes, and each starts its own pool of block
+    # workers, so n_workers is split between them rather than starting
+    # n_workers block workers for each.
+    if demand_lucodes is not None:
+        n_block_workers = n_workers // 2
+    else:
+        n_block_workers = n_workers
+
     reclass_error_details = {
         'raster_name': 'LULC', 'column_name': 'lucode',
         'table_name': 'Biophysical'}
-    # Create Kc raster from table values to use in future calculations
-    LOGGER.info("Reclassifying temp_Kc raster")
-    tmp_Kc_raster_path = os.path.join(intermediate_dir, 'kc_raster.tif')
-    create_Kc_raster_task = graph.add_task(
-        func=utils.reclassify_raster,
-        args=((clipped_lulc_path, 1), Kc_dict, tmp_Kc_raster_path,
-              gdal.GDT_Float32, nodata_dict['out_nodata'],
-              reclass_error_details),
-        target_path_list=[tmp_Kc_raster_path],
-        dependent_task_list=[align_raster_stack_task],
-        task_name='create_Kc_raster')
-
-    # Create root raster from table values to use in future calculations
-    LOGGER.info("Reclassifying tmp_root raster")
-    tmp_root_raster_path = os.path.join(
-        intermediate_dir, 'root_depth.tif')
-    create_root_raster_task = graph.add_task(
-        func=utils.reclassify_raster,
-        args=((clipped_lulc_path, 1), root_dict, tmp_root_raster_path,
-              gdal.GDT_Float32, nodata_dict['out_nodata'],
-              reclass_error_details),
-        target_path_list=[tmp_root_raster_path],
-        dependent_task_list=[align_raster_stack_task],
-        task_name='create_root_raster')
-
-    # Create veg raster from table values to use in future calculations
-    # of determining which AET equation to use
-    LOGGER.info("Reclassifying tmp_veg raster")
-    tmp_veg_raster_path = os.path.join(intermediate_dir, 'veg.tif')
-    create_veg_raster_task = graph.add_task(
-        func=utils.reclassify_raster,
-        args=((clipped_lulc_path, 1), vegetated_dict, tmp_veg_raster_path,
-              gdal.GDT_Float32, nodata_dict['out_nodata'],
-              reclass_error_details),
-        target_path_list=[tmp_veg_raster_path],
-        dependent_task_list=[align_raster_stack_task],
-        task_name='create_veg_raster')
-
     dependent_tasks_for_watersheds_list = []
 
-    LOGGER.info('Calculate PET from Ref Evap times Kc')
-    calculate_pet_task = graph.add_task(
-        func=pygeoprocessing.raster_calculator,
-        args=([(eto_path, 1), (tmp_Kc_raster_path, 1),
-               (nodata_dict['eto'], 'raw'),
-               (nodata_dict['out_nodata'], 'raw')],
-              pet_op, tmp_pet_path, gdal.GDT_Float32,
-              nodata_dict['out_nodata']),
-        target_path_list=[tmp_pet_path],
-        dependent_task_list=[create_Kc_raster_task],
-        task_name='calculate_pet')
-    dependent_tasks_for_watersheds_list.append(calculate_pet_task)
-
-    # List of rasters to pass into the vectorized fractp operation
-    raster_list = [
-        tmp_Kc_raster_path, eto_path, precip_path, tmp_root_raster_path,
-        depth_to_root_rest_layer_path, pawc_path, tmp_veg_raster_path]
-
-    LOGGER.debug('Performing fractp operation')
+    # The Kc, root depth and veg values are looked up from the LULC raster
+    # within the fractp calculation rather than reclassified to rasters of
+    # their own.  PET (Kc * ETo) is written in the same pass.
+    LOGGER.info('Performing fractp and PET operations')
     calculate_fractp_task = graph.add_task(
-        func=pygeoprocessing.raster_calculator,
-        args=([(x, 1) for x in raster_list]
-              + [(nodata_dict, 'raw'), (seasonality_constant, 'raw')],
-              fractp_op, fractp_path, gdal.GDT_Float32,
-              nodata_dict['out_nodata']),
-        target_path_list=[fractp_path],
-        dependent_task_list=[
-            create_Kc_raster_task, create_veg_raster_task,
-            create_root_raster_task, align_raster_stack_task],
-        task_name='calculate_fractp')
-
-    LOGGER.info('Performing wyield operation')
-    calculate_wyield_task = graph.add_task(
-        func=pygeoprocessing.raster_calculator,
-        args=([(fractp_path, 1), (precip_path, 1),
-               (nodata_dict['precip'], 'raw'),
-               (nodata_dict['out_nodata'], 'raw')],
-              wyield_op, wyield_path, gdal.GDT_Float32,
-              nodata_dict['out_nodata']),
-        target_path_list=[wyield_path],
+        func=calculate_fractp_and_pet,
+        args=(clipped_lulc_path, [Kc_dict, root_dict, vegetated_dict],
+              eto_path, precip_path, depth_to_root_rest_layer_path,
+              pawc_path, nodata_dict, seasonality_constant,
+              reclass_error_details, fractp_path, tmp_pet_path,
+              n_block_workers),
+        target_path_list=[fractp_path, tmp_pet_path],
+        dependent_task_list=[align_raster_stack_task],
+        task_name='calculate_fractp_and_pet')
+    dependent_tasks_for_watersheds_list.append(calculate_fractp_task)
+
+    LOGGER.info('Performing wyield and aet operations')
+    calculate_wyield_aet_task = graph.add_task(
+        func=calculate_wyield_and_aet,
+        args=(fractp_path, precip_path, nodata_dict['precip'],
+              nodata_dict['out_nodata'], wyield_path, aet_path,
+              n_block_workers),
+        target_path_list=[wyield_path, aet_path],
         dependent_task_list=[calculate_fractp_task, align_raster_stack_task],
-        task_name='calculate_wyield')
-    dependent_tasks_for_watersheds_list.append(calculate_wyield_task)
-
-    LOGGER.debug('Performing aet operation')
-    calculate_aet_task = graph.add_task(
-        func=pygeoprocessing.raster_calculator,
-        args=([(fractp_path, 1), (precip_path, 1),
-               (nodata_dict['precip'], 'raw'),
-               (nodata_dict['out_nodata'], 'raw')],
-              aet_op, aet_path, gdal.GDT_Float32, nodata_dict['out_nodata']),
-        target_path_list=[aet_path],
-        dependent_task_list=[
-            calculate_fractp_task, create_veg_raster_task,
-            align_raster_stack_task],
-        task_name='calculate_aet')
-    dependent_tasks_for_watersheds_list.append(calculate_aet_task)
+        task_name='calculate_wyield_and_aet')
+    dependent_tasks_for_watersheds_list.append(calculate_wyield_aet_task)
 
     # list of rasters that will always be summarized with zonal stats
     raster_names_paths_list = [
@@ -559,10 +514,10 @@ def execute(args):
             'table_name': 'Demand'}
         # Create demand raster from table values to use in future calculations
         create_demand_raster_task = graph.add_task(
-            func=utils.reclassify_raster,
-            args=((clipped_lulc_path, 1), demand_reclassify_dict, demand_path,
-                  gdal.GDT_Float32, nodata_dict['out_nodata'],
-                  reclass_error_details),
+            func=reclassify_lulc,
+            args=(clipped_lulc_path, demand_reclassify_dict,
+                  nodata_dict['lulc'], demand_path, nodata_dict['out_nodata'],
+                  reclass_error_details, n_block_workers),
             target_path_list=[demand_path],
             dependent_task_list=[align_raster_stack_task],
             task_name='create_demand_raster')
@@ -573,22 +528,16 @@ def execute(args):
     # scarcity and valuation calculations.
     for base_ws_path, ws_id_name, target_ws_path in watershed_paths_list:
 
-        zonal_stats_task_list = []
-        zonal_stats_pickle_list = []
-
         # Do zonal stats with the input shapefiles provided by the user
-        # and store results dictionaries in pickles
-        for key_name, rast_path in raster_names_paths_list:
-            target_stats_pickle = os.path.join(
-                pickle_dir,
-                '%s_%s%s.pickle' % (ws_id_name, key_name, file_suffix))
-            zonal_stats_pickle_list.append((target_stats_pickle, key_name))
-            zonal_stats_task_list.append(graph.add_task(
-                func=zonal_stats_tofile,
-                args=(base_ws_path, rast_path, target_stats_pickle),
-                target_path_list=[target_stats_pickle],
-                dependent_task_list=dependent_tasks_for_watersheds_list,
-                task_name='%s_%s_zonalstats' % (ws_id_name, key_name)))
+        # and store the results dictionaries in a pickle
+        target_stats_pickle = os.path.join(
+            pickle_dir, '%s_zonal_stats%s.pickle' % (ws_id_name, file_suffix))
+        zonal_stats_task = graph.add_task(
+            func=zonal_stats_tofile,
+            args=(base_ws_path, raster_names_paths_list, target_stats_pickle),
+            target_path_list=[target_stats_pickle],
+            dependent_task_list=dependent_tasks_for_watersheds_list,
+            task_name='%s_zonalstats' % ws_id_name)
 
         # Create copies of the input shapefiles in the output workspace.
         # Add the zonal stats data to the attribute tables.
@@ -596,9 +545,9 @@ def execute(args):
         create_output_vector_task = graph.add_task(
             func=create_vector_output,
             args=(base_ws_path, target_ws_path, ws_id_name,
-                  zonal_stats_pickle_list, valuation_params),
+                  target_stats_pickle, valuation_params),
             target_path_list=[target_ws_path],
-            dependent_task_list=zonal_stats_task_list,
+            dependent_task_list=[zonal_stats_task],
             task_name='create_%s_vector_output' % ws_id_name)
 
         # Export a CSV with all the fields present in the output vector
@@ -616,7 +565,7 @@ def execute(args):
 
 def create_vector_output(
         base_vector_path, target_vector_path, ws_id_name,
-        stats_path_list, valuation_params):
+        stats_path, valuation_params):
     """Create the main vector outputs of this model.
 
     Join results of zonal stats to copies of the watershed shapefiles.
@@ -631,8 +580,8 @@ def create_vector_output(
             names of a unique ID field in the watershed and subwatershed
             shapefiles, respectively. Used to determine if the polygons
             represent watersheds or subwatersheds.
-        stats_path_list (list): List of file paths to pickles storing the zonal
-            stats results.
+        stats_path (string): Path to a pickle storing the zonal stats results
+            of each raster, keyed by the raster's key name.
         valuation_params (dict): The dictionary built from
             args['valuation_table_path']. Or None if valuation table was not
             provided.
@@ -641,43 +590,159 @@ def create_vector_output(
         None
 
     """
+    # The fields are added to a copy of the vector in GDAL's in-memory
+    # filesystem, and the shapefile is written to disk only once they're
+    # all filled in, rather than updating the .dbf on disk field by field.
     esri_shapefile_driver = gdal.GetDriverByName('ESRI Shapefile')
+    working_vector_path = '/vsimem/%s_%s' % (
+        os.getpid(), os.path.basename(target_vector_path))
     watershed_vector = gdal.OpenEx(base_vector_path, gdal.OF_VECTOR)
-    esri_shapefile_driver.CreateCopy(target_vector_path, watershed_vector)
+    esri_shapefile_driver.CreateCopy(working_vector_path, watershed_vector)
     watershed_vector = None
 
-    for pickle_path, key_name in stats_path_list:
-        with open(pickle_path, 'rb') as picklefile:
-            ws_stats_dict = pickle.load(picklefile)
-
-            if key_name == 'wyield_mn':
-                _add_zonal_stats_dict_to_shape(
-                    target_vector_path, ws_stats_dict, key_name, 'mean')
-                # Also create and populate 'wyield_vol' field, which
-                # relies on 'wyield_mn' already present in attribute table
-                compute_water_yield_volume(target_vector_path)
-
-            # consum_* variables rely on 'wyield_*' fields present,
-            # so this would fail if somehow 'demand' comes before 'wyield_mn'
-            # in key_names. The order is hardcoded in raster_names_paths_list.
-            elif key_name == 'demand':
-                # Add aggregated consumption to sheds shapefiles
-                _add_zonal_stats_dict_to_shape(
-                    target_vector_path, ws_stats_dict, 'consum_vol', 'sum')
-
-                # Add aggregated consumption means to sheds shapefiles
-                _add_zonal_stats_dict_to_shape(
-                    target_vector_path, ws_stats_dict, 'consum_mn', 'mean')
-                compute_rsupply_volume(target_vector_path)
+    try:
+        _add_vector_output_fields(
+            working_vector_path, ws_id_name, stats_path, valuation_params)
+
+        working_vector = gdal.OpenEx(working_vector_path, gdal.OF_VECTOR)
+        esri_shapefile_driver.CreateCopy(target_vector_path, working_vector)
+        working_vector = None
+    finally:
+        # /vsimem files live until they're deleted, even if adding the
+        # fields failed.
+        esri_shapefile_driver.Delete(working_vector_path)
 
-            else:
-                _add_zonal_stats_dict_to_shape(
-                    target_vector_path, ws_stats_dict, key_name, 'mean')
 
-    if valuation_params:
-        # only do valuation for watersheds, not subwatersheds
-        if ws_id_name == 'ws_id':
-            compute_watershed_valuation(target_vector_path, valuation_params)
+def _add_vector_output_fields(
+        target_vector_path, ws_id_name, stats_path, valuation_params):
+    """Add the zonal stats, scarcity and valuation fields to a vector.
+
+    The vector is opened once and all of the new fields are created up
+    front.  The field values of all the features are computed column by
+    column with numpy, then written in a single pass over the features.  A
+    field is only set for a feature if zonal stats found valid pixels in the
+    polygon.
+
+    Args:
+        target_vector_path (string): Path to the copy of the watershed
+            vector to add the fields to.
+        ws_id_name (string): Either 'ws_id' or 'subws_id'.
+        stats_path (string): Path to a pickle storing the zonal stats results
+            of each raster, keyed by the raster's key name.
+        valuation_params (dict): The dictionary built from
+            args['valuation_table_path'], or None.
+
+    Returns:
+        None
+
+    """
+    with open(stats_path, 'rb') as picklefile:
+        stats_dict = pickle.load(picklefile)
+
+    vector = gdal.OpenEx(target_vector_path, gdal.OF_VECTOR | gdal.GA_Update)
+    layer = vector.GetLayer()
+
+    fid_list = []
+    area_list = []
+    ws_id_list = []
+    ws_id_index = layer.GetLayerDefn().GetFieldIndex(ws_id_name)
+    for feature in layer:
+        fid_list.append(feature.GetFID())
+        geometry = feature.GetGeometryRef()
+        area_list.append(geometry.Area() if geometry is not None else 0.0)
+        ws_id_list.append(feature.GetField(ws_id_index))
+    feature = None
+    area = numpy.array(area_list, dtype=numpy.float64)
+
+    # Each field's values and the mask of features to set them for, in the
+    # order of the rasters in raster_names_paths_list, each followed by the
+    # fields derived from it.
+    field_arrays = {}
+    for key_name, stats_map in stats_dict.items():
+        count = numpy.array(
+            [stats_map[fid]['count'] for fid in fid_list], dtype=numpy.int64)
+        value_sum = numpy.array(
+            [stats_map[fid]['sum'] for fid in fid_list], dtype=numpy.float64)
+        valid_mask = count > 0
+        mean = numpy.zeros(value_sum.shape, dtype=numpy.float64)
+        mean[valid_mask] = value_sum[valid_mask] / count[valid_mask]
+
+        if key_name == 'wyield_mn':
+            field_arrays['wyield_mn'] = (mean, valid_mask)
+            # Calculate water yield volume (m^3), 1000 is for converting
+            # the mm of wyield to meters
+            field_arrays['wyield_vol'] = (mean * area / 1000.0, valid_mask)
+        elif key_name == 'demand':
+            field_arrays['consum_vol'] = (value_sum, valid_mask)
+            field_arrays['consum_mn'] = (mean, valid_mask)
+            # Calculate realized supply.  consum_* rely on wyield_* being
+            # present, so this would fail if somehow 'demand' comes before
+            # 'wyield_mn' in the stats.  The order is hardcoded in
+            # raster_names_paths_list.
+            wyield_vol, wyield_mask = field_arrays['wyield_vol']
+            wyield_mn, _ = field_arrays['wyield_mn']
+            rsupply_mask = wyield_mask & valid_mask
+            field_arrays['rsupply_vl'] = (wyield_vol - value_sum, rsupply_mask)
+            field_arrays['rsupply_mn'] = (wyield_mn - mean, rsupply_mask)
+        else:
+            field_arrays[key_name] = (mean, valid_mask)
+
+    # only do valuation for watersheds, not subwatersheds
+    if valuation_params and ws_id_name == 'ws_id':
+        # there's no realized supply to value without a demand table
+        rsupply_vl, rsupply_mask = field_arrays.get(
+            'rsupply_vl', (area, numpy.zeros(area.shape, dtype=bool)))
+        energy = numpy.zeros(rsupply_vl.shape, dtype=numpy.float64)
+        npv = numpy.zeros(rsupply_vl.shape, dtype=numpy.float64)
+        valued_index = numpy.flatnonzero(rsupply_mask)
+        if valued_index.size > 0:
+            # One array per valuation table column, aligned with the
+            # features being valued.
+            val_row_list = [
+                valuation_params[ws_id_list[index]]
+                for index in valued_index]
+            val_arrays = {
+                column: numpy.array(
+                    [val_row[column] for val_row in val_row_list],
+                    dtype=numpy.float64)
+                for column in (
+                    'efficiency', 'fraction', 'height', 'kw_price', 'cost',
+                    'time_span', 'discount')}
+            energy[valued_index], npv[valued_index] = (
+                compute_hydropower_valuation(
+                    val_arrays, rsupply_vl[valued_index]))
+        field_arrays['hp_energy'] = (energy, rsupply_mask)
+        field_arrays['hp_val'] = (npv, rsupply_mask)
+
+    field_defn_list = []
+    for field_name in field_arrays:
+        field_defn = ogr.FieldDefn(field_name, ogr.OFTReal)
+        field_defn.SetWidth(24)
+        field_defn.SetPrecision(11)
+        field_defn_list.append(field_defn)
+    layer.CreateFields(field_defn_list)
+
+    # Look the new fields' indexes up once rather than by name for
+    # every feature.
+    layer_defn = layer.GetLayerDefn()
+    field_index_list = [
+        (layer_defn.GetFieldIndex(field_name), values, valid_mask)
+        for field_name, (values, valid_mask) in field_arrays.items()]
+
+    layer.ResetReading()
+    for index, feature in enumerate(layer):
+        feature_updated = False
+        for field_index, values, valid_mask in field_index_list:
+            if valid_mask[index]:
+                feature.SetField(field_index, float(values[index]))
+                feature_updated = True
+        # features without any results are left as they are
+        if feature_updated:
+            layer.SetFeature(feature)
+
+    feature = None
+    layer = None
+    vector = None
 
 
 def convert_vector_to_csv(base_vector_path, target_csv_path):
@@ -698,411 +763,805 @@ def convert_vector_to_csv(base_vector_path, target_csv_path):
     _ = csv_driver.CreateCopy(target_csv_path, watershed_vector)
 
 
-def zonal_stats_tofile(base_vector_path, raster_path, target_stats_pickle):
+def zonal_stats_tofile(
+        base_vector_path, raster_names_paths_list, target_stats_pickle):
     """Calculate zonal statistics for watersheds and write results to a file.
 
+    The watershed polygons are rasterized onto the grid shared by all the
+    rasters in ``raster_names_paths_list``, and every raster is summarized
+    in the same pass over that mask.  As in
+    ``pygeoprocessing.zonal_statistics``, polygons that overlap are split
+    into sets of disjoint polygons that are rasterized and summarized in
+    turn, and a polygon too small to contain any pixel centers is summarized
+    over the pixels that intersect its bounding box.
+
     Args:
         base_vector_path (string): Path to the watershed shapefile in the
             output workspace.
-        raster_path (string): Path to raster to aggregate.
-        target_stats_pickle (string): Path to pickle file to store dictionary
-            returned by zonal stats.
+        raster_names_paths_list (list): list of (key_name, raster_path)
+            tuples of the rasters to aggregate.  All rasters must be aligned.
+        target_stats_pickle (string): Path to pickle file to store a
+            dictionary mapping each key_name to a dictionary in the format
+            returned by ``pygeoprocessing.zonal_statistics`` for that raster.
 
     Returns:
         None
 
     """
-    ws_stats_dict = pygeoprocessing.zonal_statistics(
-        (raster_path, 1), base_vector_path, ignore_nodata=True)
+    working_dir = tempfile.mkdtemp(
+        dir=os.path.dirname(target_stats_pickle))
+    try:
+        stats_dict = _calculate_zonal_stats(
+            base_vector_path, raster_names_paths_list, working_dir)
+    finally:
+        shutil.rmtree(working_dir, ignore_errors=True)
+
     with open(target_stats_pickle, 'wb') as picklefile:
-        picklefile.write(pickle.dumps(ws_stats_dict))
+        pickle.dump(stats_dict, picklefile, pickle.HIGHEST_PROTOCOL)
 
 
-def aet_op(fractp, precip, precip_nodata, output_nodata):
-    """Compute actual evapotranspiration values.
+def _calculate_zonal_stats(
+        base_vector_path, raster_names_paths_list, working_dir):
+    """Calculate the zonal statistics of aligned rasters under polygons.
 
     Args:
-        fractp (numpy.ndarray float): fractp raster values.
-        precip (numpy.ndarray): precipitation raster values (mm).
-        precip_nodata (float): nodata value from the precip raster.
-        output_nodata (float): nodata value assigned to output of
-            raster_calculator.
+        base_vector_path (string): Path to the polygon vector.
+        raster_names_paths_list (list): list of (key_name, raster_path)
+            tuples of the rasters to aggregate.  All rasters must be aligned.
+        working_dir (string): Path to a directory to write the rasterized
+            polygons to.
 
     Returns:
-        numpy.ndarray of actual evapotranspiration values (mm).
+        A dictionary mapping each key_name to a dictionary in the format
+        returned by ``pygeoprocessing.zonal_statistics`` for that raster.
 
     """
-    result = numpy.empty_like(fractp)
-    result[:] = output_nodata
-    # checking if fractp >= 0 because it's a value that's between 0 and 1
-    # and the nodata value is a large negative number.
-    valid_mask = fractp >= 0
-    if precip_nodata is not None:
-        valid_mask &= ~numpy.isclose(precip, precip_nodata)
-    result[valid_mask] = fractp[valid_mask] * precip[valid_mask]
-    return result
+    base_raster_path = raster_names_paths_list[0][1]
+    base_raster_info = pygeoprocessing.get_raster_info(base_raster_path)
+    zone_nodata = -1
+    zone_raster_path = os.path.join(working_dir, 'zones.tif')
+    pygeoprocessing.new_raster_from_base(
+        base_raster_path, zone_raster_path, gdal.GDT_Int32, [zone_nodata])
+    # fetch the block offsets before the raster is opened for writing
+    block_info_list = list(pygeoprocessing.iterblocks(
+        (zone_raster_path, 1), offset_only=True))
+
+    # Burn each feature's index in fid_list rather than its FID so that the
+    # statistics arrays below can be indexed directly by the mask values.
+    watershed_vector = gdal.OpenEx(base_vector_path, gdal.OF_VECTOR)
+    watershed_layer = watershed_vector.GetLayer()
+    fid_list = [
+        watershed_feature.GetFID() for watershed_feature in watershed_layer]
+    zone_index_map = {
+        fid: zone_index for zone_index, fid in enumerate(fid_list)}
+
+    # Each pixel of the mask can only hold one polygon, so polygons that
+    # overlap are rasterized in separate passes.  Features without a
+    # geometry or outside of the rasters are in none of the sets.
+    disjoint_fid_sets = pygeoprocessing.calculate_disjoint_polygon_set(
+        base_vector_path, bounding_box=base_raster_info['bounding_box'])
+
+    raster_tuple_list = []
+    for _, raster_path in raster_names_paths_list:
+        raster = gdal.OpenEx(raster_path, gdal.OF_RASTER)
+        band = raster.GetRasterBand(1)
+        raster_tuple_list.append((raster, band, band.GetNoDataValue()))
+
+    # One row per raster, one column per watershed.
+    stats_shape = (len(raster_tuple_list), len(fid_list))
+    count = numpy.zeros(stats_shape, dtype=numpy.int64)
+    nodata_count = numpy.zeros(stats_shape, dtype=numpy.int64)
+    value_sum = numpy.zeros(stats_shape, dtype=numpy.float64)
+    value_min = numpy.full(stats_shape, numpy.inf, dtype=numpy.float64)
+    value_max = numpy.full(stats_shape, -numpy.inf, dtype=numpy.float64)
+
+    zone_raster = gdal.OpenEx(
+        zone_raster_path, gdal.OF_RASTER | gdal.GA_Update)
+    zone_band = zone_raster.GetRasterBand(1)
+    zone_vector = ogr.GetDriverByName('MEMORY').CreateDataSource('zones')
+    for set_index, disjoint_fid_set in enumerate(disjoint_fid_sets):
+        zone_layer = zone_vector.CreateLayer(
+            'zones', watershed_layer.GetSpatialRef(), ogr.wkbPolygon)
+        zone_layer.CreateField(ogr.FieldDefn('zone_index', ogr.OFTInteger))
+        zone_layer_defn = zone_layer.GetLayerDefn()
+        zone_layer.StartTransaction()
+        for fid in disjoint_fid_set:
+            watershed_feature = watershed_layer.GetFeature(fid)
+            zone_feature = ogr.Feature(zone_layer_defn)
+            zone_feature.SetField('zone_index', zone_index_map[fid])
+            zone_feature.SetGeometry(
+                watershed_feature.GetGeometryRef().Clone())
+            zone_layer.CreateFeature(zone_feature)
+        zone_layer.CommitTransaction()
+        watershed_feature = None
 
+        # the mask is created as nodata, so only clear it for later sets
+        if set_index > 0:
+            zone_band.Fill(zone_nodata)
+        gdal.RasterizeLayer(
+            zone_raster, [1], zone_layer,
+            options=['ALL_TOUCHED=FALSE', 'ATTRIBUTE=zone_index'])
+        zone_raster.FlushCache()
+        zone_layer = None
+        zone_vector.DeleteLayer(0)
+
+        for block_info in block_info_list:
+            zone_block = zone_band.ReadAsArray(**block_info)
+            if (zone_block == zone_nodata).all():
+                continue
+            for raster_index, (_, band, nodata) in enumerate(
+                    raster_tuple_list):
+                value_block, = _as_kernel_arrays(
+                    [band.ReadAsArray(**block_info)])
+                hydropower_water_yield_core.accumulate_zonal_stats(
+                    zone_block, value_block,
+                    nodata, count[raster_index], nodata_count[raster_index],
+                    value_sum[raster_index], value_min[raster_index],
+                    value_max[raster_index])
+    zone_vector = None
+    zone_band = None
+    zone_raster = None
+
+    stats_dict = {}
+    for raster_index, (key_name, _) in enumerate(raster_names_paths_list):
+        stats_dict[key_name] = {}
+        for zone_index, fid in enumerate(fid_list):
+            if count[raster_index, zone_index] > 0:
+                zone_min = value_min[raster_index, zone_index]
+                zone_max = value_max[raster_index, zone_index]
+            else:
+                zone_min = None
+                zone_max = None
+            stats_dict[key_name][fid] = {
+                'min': zone_min,
+                'max': zone_max,
+                'count': int(count[raster_index, zone_index]),
+                'nodata_count': int(nodata_count[raster_index, zone_index]),
+                'sum': float(value_sum[raster_index, zone_index])}
+
+    # The mask is shared, so a feature that didn't cover any pixel centers
+    # has no pixels counted for any of the rasters.
+    # The base raster is already open, so take its size and geotransform
+    # from that rather than opening it again.
+    base_raster = raster_tuple_list[0][0]
+    n_cols, n_rows = base_raster.RasterXSize, base_raster.RasterYSize
+    base_geotransform = base_raster.GetGeoTransform()
+    base_raster = None
+    for zone_index in numpy.flatnonzero(
+            (count[0] + nodata_count[0]) == 0):
+        fid = fid_list[zone_index]
+        watershed_feature = watershed_layer.GetFeature(fid)
+        watershed_geom = watershed_feature.GetGeometryRef()
+        if watershed_geom is None:
+            LOGGER.warning(f'no geometry in {base_vector_path} FID: {fid}')
+            continue
+        window = _get_envelope_window(
+            watershed_geom.GetEnvelope(), base_geotransform, n_cols, n_rows)
+        if window is None:
+            continue
+        for raster_index, (key_name, _) in enumerate(
+                raster_names_paths_list):
+            _, band, nodata = raster_tuple_list[raster_index]
+            window_array = band.ReadAsArray(**window)
+            if nodata is not None:
+                window_nodata_mask = numpy.isclose(window_array, nodata)
+            else:
+                window_nodata_mask = numpy.zeros(
+                    window_array.shape, dtype=bool)
+            valid_window_array = window_array[~window_nodata_mask]
+            zone_stats = stats_dict[key_name][fid]
+            if valid_window_array.size == 0:
+                zone_stats['min'] = 0.0
+                zone_stats['max'] = 0.0
+                zone_stats['sum'] = 0.0
+            else:
+                zone_stats['min'] = float(numpy.min(valid_window_array))
+                zone_stats['max'] = float(numpy.max(valid_window_array))
+                zone_stats['sum'] = float(numpy.sum(
+                    valid_window_array, dtype=numpy.float64))
+            zone_stats['count'] = int(valid_window_array.size)
+            zone_stats['nodata_count'] = int(
+                numpy.count_nonzero(window_nodata_mask))
+
+    watershed_geom = None
+    watershed_feature = None
+    watershed_layer = None
+    watershed_vector = None
+    raster_tuple_list = None
+    return stats_dict
 
-def wyield_op(fractp, precip, precip_nodata, output_nodata):
-    """Calculate water yield.
+
+def _get_envelope_window(envelope, geotransform, n_cols, n_rows):
+    """Find the raster window that intersects a geometry's bounding box.
 
     Args:
-        fractp (numpy.ndarray float): fractp raster values.
-        precip (numpy.ndarray): precipitation raster values (mm).
-        precip_nodata (float): nodata value from the precip raster.
-        output_nodata (float): nodata value assigned to output of
-            raster_calculator.
+        envelope (tuple): (min_x, max_x, min_y, max_y) bounding box, as
+            returned by ``ogr.Geometry.GetEnvelope``.
+        geotransform (list): the raster's 6-element geotransform.
+        n_cols (int): number of columns in the raster.
+        n_rows (int): number of rows in the raster.
 
     Returns:
-        numpy.ndarray of water yield value (mm).
+        A dict with the keys 'xoff', 'yoff', 'win_xsize' and 'win_ysize'
+        that can be passed to ``gdal.Band.ReadAsArray``, or None if the
+        bounding box does not intersect the raster.
 
     """
-    result = numpy.empty_like(fractp)
-    result[:] = output_nodata
-    # output_nodata is defined above, should never be None
-    valid_mask = ~numpy.isclose(fractp, output_nodata)
-    if precip_nodata is not None:
-        valid_mask &= ~numpy.isclose(precip, precip_nodata)
-    result[valid_mask] = (1.0 - fractp[valid_mask]) * precip[valid_mask]
-    return result
-
-
-def fractp_op(
-        Kc, eto, precip, root, soil, pawc, veg,
-        nodata_dict, seasonality_constant):
-    """Calculate actual evapotranspiration fraction of precipitation.
+    min_x, max_x, min_y, max_y = envelope
+    if geotransform[1] < 0:
+        min_x, max_x = max_x, min_x
+    if geotransform[5] < 0:
+        min_y, max_y = max_y, min_y
+
+    xoff = int((min_x - geotransform[0]) / geotransform[1])
+    yoff = int((min_y - geotransform[3]) / geotransform[5])
+    win_xsize = int(numpy.ceil(
+        (max_x - geotransform[0]) / geotransform[1])) - xoff
+    win_ysize = int(numpy.ceil(
+        (max_y - geotransform[3]) / geotransform[5])) - yoff
+
+    # clamp the window to the extents of the raster
+    if xoff < 0:
+        win_xsize += xoff
+        xoff = 0
+    if yoff < 0:
+        win_ysize += yoff
+        yoff = 0
+    win_xsize = min(win_xsize, n_cols - xoff)
+    win_ysize = min(win_ysize, n_rows - yoff)
+
+    if win_xsize <= 0 or win_ysize <= 0:
+        return None
+    return {
+        'xoff': xoff, 'yoff': yoff,
+        'win_xsize': win_xsize, 'win_ysize': win_ysize}
+
+
+def calculate_fractp_and_pet(
+        lulc_path, value_map_list, eto_path, precip_path,
+        depth_to_root_rest_layer_path, pawc_path, nodata_dict,
+        seasonality_constant, error_details, target_fractp_path,
+        target_pet_path, n_workers=-1):
+    """Calculate the fractp and PET rasters in one pass over the inputs.
+
+    The Kc, root depth and vegetation values of each pixel are looked up
+    from the biophysical table by landcover code within the same block loop,
+    so they're never written to rasters of their own.  Landcover nodata
+    pixels map to ``nodata_dict['out_nodata']``, as in
+    ``utils.reclassify_raster``, unless the nodata value is also a landcover
+    code in the value maps.
 
     Args:
-        Kc (numpy.ndarray): Kc (plant evapotranspiration
-          coefficient) raster values
-        eto (numpy.ndarray): potential evapotranspiration raster
-          values (mm)
-        precip (numpy.ndarray): precipitation raster values (mm)
-        root (numpy.ndarray): root depth (maximum root depth for
-           vegetated land use classes) raster values (mm)
-        soil (numpy.ndarray): depth to root restricted layer raster
-            values (mm)
-        pawc (numpy.ndarray): plant available water content raster
-           values
-        veg (numpy.ndarray): 1 or 0 where 1 depicts the land type as
-            vegetation and 0 depicts the land type as non
-            vegetation (wetlands, urban, water, etc...). If 1 use
-            regular AET equation if 0 use: AET = Kc * ETo
-        nodata_dict (dict): stores nodata values keyed by raster names
+        lulc_path (string): path to the landcover raster.
+        value_map_list (list): the Kc, root depth and veg dictionaries of
+            {lucode: value, ...}, in that order.  All of the dictionaries
+            must have the same keys.
+        eto_path (string): path to the reference evapotranspiration raster
+            (mm).
+        precip_path (string): path to the precipitation raster (mm).
+        depth_to_root_rest_layer_path (string): path to the depth to root
+            restricted layer raster (mm).
+        pawc_path (string): path to the plant available water content
+            raster.
+        nodata_dict (dict): stores nodata values keyed by raster names.
         seasonality_constant (float): floating point value between
             1 and 30 corresponding to the seasonal distribution of
             precipitation.
+        error_details (dict): a dictionary with the keys 'raster_name',
+            'column_name' and 'table_name', as for
+            ``utils.reclassify_raster``.
+        target_fractp_path (string): path to the actual evapotranspiration
+            fraction of precipitation raster created by this function.
+        target_pet_path (string): path to the potential evapotranspiration
+            raster (mm) created by this function.
+        n_workers (int): the number of worker processes to compute blocks
+            in.  Blocks are computed in this process if less than 2.
 
     Returns:
-        numpy.ndarray (float) of actual evapotranspiration as fraction
-            of precipitation.
+        None
+
+    Raises:
+        ValueError if a pixel value from ``lulc_path`` is not a key in the
+        value maps.
 
     """
-    # Kc, root, & veg were created by reclassify_raster, which set nodata
-    # to out_nodata. All others are products of align_and_resize_raster_stack
-    # and retain their original nodata values.
-    # out_nodata is defined above and should never be None.
-    valid_mask = (
-        ~numpy.isclose(Kc, nodata_dict['out_nodata']) &
-        ~numpy.isclose(root, nodata_dict['out_nodata']) &
-        ~numpy.isclose(veg, nodata_dict['out_nodata']) &
-        ~numpy.isclose(precip, 0.0))
-    if nodata_dict['eto'] is not None:
-        valid_mask &= ~numpy.isclose(eto, nodata_dict['eto'])
-    if nodata_dict['precip'] is not None:
-        valid_mask &= ~numpy.isclose(precip, nodata_dict['precip'])
-    if nodata_dict['depth_root'] is not None:
-        valid_mask &= ~numpy.isclose(soil, nodata_dict['depth_root'])
-    if nodata_dict['pawc'] is not None:
-        valid_mask &= ~numpy.isclose(pawc, nodata_dict['pawc'])
-
-    # Compute Budyko Dryness index
-    # Use the original AET equation if the land cover type is vegetation
-    # If not vegetation (wetlands, urban, water, etc...) use
-    # Alternative equation Kc * Eto
-    phi = (Kc[valid_mask] * eto[valid_mask]) / precip[valid_mask]
-    pet = Kc[valid_mask] * eto[valid_mask]
-
-    # Calculate plant available water content (mm) using the minimum
-    # of soil depth and root depth
-    awc = numpy.where(
-        root[valid_mask] < soil[valid_mask], root[valid_mask],
-        soil[valid_mask]) * pawc[valid_mask]
-    climate_w = (
-        (awc / precip[valid_mask]) * seasonality_constant) + 1.25
-    # Capping to 5.0 to set to upper limit if exceeded
-    climate_w[climate_w > 5.0] = 5.0
-
-    # Compute evapotranspiration partition of the water balance
-    aet_p = (
-        1.0 + (pet / precip[valid_mask])) - (
-            (1.0 + (pet / precip[valid_mask]) ** climate_w) ** (
-                1.0 / climate_w))
-
-    # We take the minimum of the following values (phi, aet_p)
-    # to determine the evapotranspiration partition of the
-    # water balance (see users guide)
-    veg_result = numpy.where(phi < aet_p, phi, aet_p)
-    # Take the minimum of precip and Kc * ETo to avoid x / p > 1.0
-    nonveg_result = Kc[valid_mask] * eto[valid_mask]
-    nonveg_mask = precip[valid_mask] < Kc[valid_mask] * eto[valid_mask]
-    nonveg_result[nonveg_mask] = precip[valid_mask][nonveg_mask]
-    nonveg_result_fract = nonveg_result / precip[valid_mask]
-
-    # If veg is 1.0 use the result for vegetated areas else use result
-    # for non veg areas
-    result = numpy.where(
-        veg[valid_mask] == 1.0,
-        veg_result, nonveg_result_fract)
-
-    fractp = numpy.empty(valid_mask.shape, dtype=numpy.float32)
-    fractp[:] = nodata_dict['out_nodata']
-    fractp[valid_mask] = result
-    return fractp
-
-
-def pet_op(eto_pix, Kc_pix, eto_nodata, output_nodata):
-    """Calculate the plant potential evapotranspiration.
+    out_nodata = nodata_dict['out_nodata']
+    kc_dict, root_dict, veg_dict = [
+        value_map.copy() for value_map in value_map_list]
+    # Landcover nodata pixels are only nodata in the results if the nodata
+    # value isn't also a landcover code of the biophysical table.
+    skip_lulc_nodata_blocks = (
+        nodata_dict['lulc'] is not None and
+        nodata_dict['lulc'] not in kc_dict)
+    if skip_lulc_nodata_blocks:
+        kc_dict[nodata_dict['lulc']] = out_nodata
+        root_dict[nodata_dict['lulc']] = out_nodata
+        veg_dict[nodata_dict['lulc']] = hydropower_water_yield_core.VEG_NODATA
+    keys = numpy.array(sorted(kc_dict))
+    # float32 to match the precision of the rasters these values were
+    # previously reclassified to.
+    kc_lut, root_lut = [
+        numpy.array([value_map[key] for key in keys], dtype=numpy.float32)
+        for value_map in (kc_dict, root_dict)]
+    # veg is only ever 0 or 1, so a byte per class is enough.
+    veg_lut = numpy.array([veg_dict[key] for key in keys], dtype=numpy.uint8)
+
+    key_index_lut = _get_key_index_lut(keys, nodata_dict['lulc'])
+    _calculate_blocks(
+        _fractp_and_pet_block_op,
+        (keys, key_index_lut, kc_lut, root_lut, veg_lut, nodata_dict,
+         seasonality_constant, error_details, skip_lulc_nodata_blocks),
+        [lulc_path, eto_path, precip_path, depth_to_root_rest_layer_path,
+         pawc_path],
+        [target_fractp_path, target_pet_path], out_nodata, n_workers)
+
+
+def _fractp_and_pet_block_op(
+        keys, key_index_lut, kc_lut, root_lut, veg_lut, nodata_dict,
+        seasonality_constant, error_details, skip_lulc_nodata_blocks,
+        base_band_list, block_info):
+    """Calculate one block of the fractp and PET rasters.
 
     Args:
-        eto_pix (numpy.ndarray): a numpy array of ETo
-        Kc_pix (numpy.ndarray): a numpy array of  Kc coefficient
-        precip_nodata (float): nodata value from the precip raster
-        output_nodata (float): nodata value assigned to output of
-            raster_calculator
+        keys (numpy.ndarray): sorted landcover codes of the lookup arrays.
+        key_index_lut (numpy.ndarray or None): the lookup array returned by
+            ``_get_key_index_lut`` for ``keys`` and the landcover nodata.
+        kc_lut (numpy.ndarray): Kc value of each landcover code in ``keys``.
+        root_lut (numpy.ndarray): root depth of each code in ``keys``.
+        veg_lut (numpy.ndarray): uint8 veg value of each code in ``keys``.
+        nodata_dict (dict): stores nodata values keyed by raster names.
+        seasonality_constant (float): the seasonality constant.
+        error_details (dict): as for ``calculate_fractp_and_pet``.
+        skip_lulc_nodata_blocks (bool): whether landcover nodata pixels map
+            to nodata, so that blocks of only landcover nodata can be filled
+            with nodata without reading the other inputs.
+        base_band_list (list): the landcover, ETo, precipitation, depth to
+            root restricting layer and PAWC bands, in that order.
+        block_info (dict): the block's offset and size, as returned by
+            ``pygeoprocessing.iterblocks``.
 
     Returns:
-        numpy.ndarray of potential evapotranspiration (mm)
+        A (fractp, pet) tuple of float32 arrays.
+
+    Raises:
+        ValueError if a pixel value of the landcover block is not in
+        ``keys``.
 
     """
-    result = numpy.empty(eto_pix.shape, dtype=numpy.float32)
-    result[:] = output_nodata
+    lulc_block = base_band_list[0].ReadAsArray(**block_info)
+    # Blocks outside of the landcover data are nodata in both results, so
+    # don't read the other inputs for them.
+    if (skip_lulc_nodata_blocks and
+            (lulc_block == nodata_dict['lulc']).all()):
+        return tuple(
+            numpy.full(lulc_block.shape, nodata_dict['out_nodata'],
+                       dtype=numpy.float32)
+            for _ in range(2))
+
+    lulc_index = _get_key_index(
+        lulc_block, keys, key_index_lut, nodata_dict['lulc'], error_details)
+
+    eto_block, precip_block, soil_block, pawc_block = _as_kernel_arrays(
+        [band.ReadAsArray(**block_info) for band in base_band_list[1:]])
+    fractp_block = numpy.empty(lulc_block.shape, dtype=numpy.float32)
+    pet_block = numpy.empty(lulc_block.shape, dtype=numpy.float32)
+    hydropower_water_yield_core.calculate_fractp_and_pet(
+        lulc_index, kc_lut, root_lut, veg_lut, eto_block, precip_block,
+        soil_block, pawc_block, nodata_dict['out_nodata'],
+        nodata_dict['eto'], nodata_dict['precip'], nodata_dict['depth_root'],
+        nodata_dict['pawc'], seasonality_constant, fractp_block, pet_block)
+    return fractp_block, pet_block
+
+
+def _get_key_index_lut(keys, lulc_nodata):
+    """Build a dense array to look up landcover codes' indexes in ``keys``.
+
+    Landcover codes are usually small non-negative integers, so they can be
+    mapped to their index in ``keys`` with one array lookup rather than a
+    search.  The nodata value is often negative or very large, so it's left
+    out of the array and looked up separately by ``_get_key_index``.
 
-    valid_mask = ~numpy.isclose(Kc_pix, output_nodata)
-    if eto_nodata is not None:
-        valid_mask &= ~numpy.isclose(eto_pix, eto_nodata)
-    result[valid_mask] = eto_pix[valid_mask] * Kc_pix[valid_mask]
-    return result
+    Args:
+        keys (numpy.ndarray): sorted landcover codes.
+        lulc_nodata (number or None): nodata value of the landcover raster.
 
+    Returns:
+        A numpy.ndarray of the index in ``keys`` of each landcover code from 0
+        to the largest key other than ``lulc_nodata``, or -1 for codes that
+        aren't keys.  None if those keys aren't all integers from 0 to
+        ``_MAX_DENSE_LUCODE``.
 
-def compute_watershed_valuation(watershed_results_vector_path, val_dict):
-    """Compute net present value and energy for the watersheds.
+    """
+    key_mask = numpy.ones(keys.shape, dtype=bool)
+    if lulc_nodata is not None:
+        key_mask &= keys != lulc_nodata
+    dense_keys = keys[key_mask]
+    if (dense_keys.size > 0 and dense_keys[0] >= 0 and
+            dense_keys[-1] < _MAX_DENSE_LUCODE and
+            numpy.all(dense_keys == numpy.floor(dense_keys))):
+        key_index_lut = numpy.full(
+            int(dense_keys[-1]) + 1, -1, dtype=numpy.intp)
+        key_index_lut[dense_keys.astype(numpy.intp)] = numpy.flatnonzero(
+            key_mask)
+        return key_index_lut
+    return None
+
+
+def _get_key_index(
+        lulc_block, keys, key_index_lut, lulc_nodata, error_details):
+    """Find the index in ``keys`` of each pixel of a landcover block.
 
     Args:
-        watershed_results_vector_path (string):
-            Path to an OGR shapefile for the watershed results.
-            Where the results will be added.
-        val_dict (dict): a python dictionary that has all the valuation
-            parameters for each watershed.
+        lulc_block (numpy.ndarray): landcover codes.
+        keys (numpy.ndarray): sorted landcover codes.
+        key_index_lut (numpy.ndarray or None): the lookup array returned by
+            ``_get_key_index_lut`` for ``keys`` and ``lulc_nodata``.
+        lulc_nodata (number or None): nodata value of the landcover raster.
+            If not None, it must be in ``keys``.
+        error_details (dict): a dictionary with the keys 'raster_name',
+            'column_name' and 'table_name', as for
+            ``utils.reclassify_raster``.
 
     Returns:
-        None.
+        A numpy.ndarray of indexes with the same shape as ``lulc_block``.
+
+    Raises:
+        ValueError if a value of ``lulc_block`` is not in ``keys``.
 
     """
-    ws_ds = gdal.OpenEx(
-        watershed_results_vector_path, gdal.OF_VECTOR | gdal.GA_Update)
-    ws_layer = ws_ds.GetLayer()
+    if key_index_lut is not None and lulc_block.dtype.kind in 'iu':
+        key_index = key_index_lut[numpy.clip(
+            lulc_block.astype(numpy.intp, copy=False), 0,
+            key_index_lut.size - 1)]
+        key_index[(lulc_block < 0) | (lulc_block >= key_index_lut.size)] = -1
+        if lulc_nodata is not None:
+            key_index[lulc_block == lulc_nodata] = numpy.searchsorted(
+                keys, lulc_nodata)
+        missing_mask = key_index < 0
+        if missing_mask.any():
+            missing_values = numpy.unique(lulc_block[missing_mask])
+        else:
+            missing_values = None
+    else:
+        unique = numpy.unique(lulc_block)
+        has_map = numpy.in1d(unique, keys)
+        missing_values = None if has_map.all() else unique[~has_map]
+        key_index = numpy.digitize(lulc_block, keys, right=True)
+    if missing_values is not None:
+        raster_name = error_details['raster_name']
+        raise ValueError(
+            f"Values in the {raster_name} raster were found that are not"
+            f" represented under the '{error_details['column_name']}'"
+            f" column of the {error_details['table_name']} table. The"
+            f" missing values found in the {raster_name} raster but not"
+            f" the table are: {missing_values}.")
+    return key_index
+
+
+def reclassify_lulc(
+        lulc_path, value_map, lulc_nodata, target_raster_path,
+        target_nodata, error_details, n_workers=-1):
+    """Reclassify a landcover raster to a float32 raster.
+
+    This behaves like ``utils.reclassify_raster``, but looks landcover codes
+    up with ``_get_key_index`` and can compute blocks in worker processes.
+    Landcover nodata pixels are set to ``target_nodata`` unless the nodata
+    value is a key of ``value_map``.
 
-    # The field names for the new attributes
-    energy_field = 'hp_energy'
-    npv_field = 'hp_val'
+    Args:
+        lulc_path (string): path to a single band landcover raster.
+        value_map (dict): a dictionary of {lucode: value, ...}.
+        lulc_nodata (number or None): nodata value of the landcover raster.
+        target_raster_path (string): path to the float32 raster created by
+            this function.
+        target_nodata (float): the nodata value of the target raster.
+        error_details (dict): a dictionary with the keys 'raster_name',
+            'column_name' and 'table_name', as for
+            ``utils.reclassify_raster``.
+        n_workers (int): the number of worker processes to compute blocks
+            in.  Blocks are computed in this process if less than 2.
 
-    # Add the new fields to the shapefile
-    for new_field in [energy_field, npv_field]:
-        field_defn = ogr.FieldDefn(new_field, ogr.OFTReal)
-        field_defn.SetWidth(24)
-        field_defn.SetPrecision(11)
-        ws_layer.CreateField(field_defn)
-
-    ws_layer.ResetReading()
-    # Iterate over the number of features (polygons)
-    for ws_feat in ws_layer:
-        # Get the watershed ID to index into the valuation parameter dictionary
-        # Since we only allow valuation on watersheds (not subwatersheds)
-        # it's okay to hardcode 'ws_id' here.
-        ws_id = ws_feat.GetField('ws_id')
-        # Get the rsupply volume for the watershed
-        rsupply_vl = ws_feat.GetField('rsupply_vl')
-
-        # there won't be a rsupply_vl value if the polygon feature only
-        # covers nodata raster values, so check before doing math.
-        if rsupply_vl is not None:
-            # Get the valuation parameters for watershed 'ws_id'
-            val_row = val_dict[ws_id]
-
-            # Compute hydropower energy production (KWH)
-            # This is from the equation given in the Users' Guide
-            energy = (
-                val_row['efficiency'] * val_row['fraction'] *
-                val_row['height'] * rsupply_vl * 0.00272)
-
-            dsum = 0.
-            # Divide by 100 because it is input at a percent and we need
-            # decimal value
-            disc = val_row['discount'] / 100.0
-            # To calculate the summation of the discount rate term over the life
-            # span of the dam we can use a geometric series
-            ratio = 1. / (1. + disc)
-            if ratio != 1.:
-                dsum = (1. - math.pow(ratio, val_row['time_span'])) / (1. - ratio)
-
-            npv = ((val_row['kw_price'] * energy) - val_row['cost']) * dsum
-
-            # Get the volume field index and add value
-            ws_feat.SetField(energy_field, energy)
-            ws_feat.SetField(npv_field, npv)
-
-            ws_layer.SetFeature(ws_feat)
-
-
-def compute_rsupply_volume(watershed_results_vector_path):
-    """Calculate the total realized water supply volume.
-
-    And the mean realized water supply volume per pixel for the given sheds.
-    Output units in cubic meters and cubic meters per pixel respectively.
+    Returns:
+        None
+
+    Raises:
+        ValueError if a pixel value from ``lulc_path`` is not a key in
+        ``value_map``.
+
+    """
+    value_map = value_map.copy()
+    if lulc_nodata is not None and lulc_nodata not in value_map:
+        value_map[lulc_nodata] = target_nodata
+    keys = numpy.array(sorted(value_map))
+    value_lut = numpy.array(
+        [value_map[key] for key in keys], dtype=numpy.float32)
+    _calculate_blocks(
+        _reclassify_block_op,
+        (keys, _get_key_index_lut(keys, lulc_nodata), value_lut, lulc_nodata,
+         error_details),
+        [lulc_path], [target_raster_path], target_nodata, n_workers)
+
+
+def _reclassify_block_op(
+        keys, key_index_lut, value_lut, lulc_nodata, error_details,
+        base_band_list, block_info):
+    """Reclassify one block of a landcover raster.
 
     Args:
-        watershed_results_vector_path (string): a path to a vector that
-            contains fields 'wyield_vol' and 'wyield_mn'.
+        keys (numpy.ndarray): sorted landcover codes of ``value_lut``.
+        key_index_lut (numpy.ndarray or None): the lookup array returned by
+            ``_get_key_index_lut`` for ``keys`` and ``lulc_nodata``.
+        value_lut (numpy.ndarray): float32 value of each code in ``keys``.
+        lulc_nodata (number or None): nodata value of the landcover raster.
+        error_details (dict): as for ``reclassify_lulc``.
+        base_band_list (list): the landcover band.
+        block_info (dict): the block's offset and size, as returned by
+            ``pygeoprocessing.iterblocks``.
 
     Returns:
-        None.
+        A tuple of the float32 reclassified block.
 
     """
-    ws_ds = gdal.OpenEx(
-        watershed_results_vector_path, gdal.OF_VECTOR | gdal.GA_Update)
-    ws_layer = ws_ds.GetLayer()
+    lulc_block = base_band_list[0].ReadAsArray(**block_info)
+    return (value_lut[_get_key_index(
+        lulc_block, keys, key_index_lut, lulc_nodata, error_details)],)
 
-    # The field names for the new attributes
-    rsupply_vol_name = 'rsupply_vl'
-    rsupply_mn_name = 'rsupply_mn'
 
-    # Add the new fields to the shapefile
-    for new_field in [rsupply_vol_name, rsupply_mn_name]:
-        field_defn = ogr.FieldDefn(new_field, ogr.OFTReal)
-        field_defn.SetWidth(24)
-        field_defn.SetPrecision(11)
-        ws_layer.CreateField(field_defn)
+def calculate_wyield_and_aet(
+        fractp_path, precip_path, precip_nodata, output_nodata,
+        target_wyield_path, target_aet_path, n_workers=-1):
+    """Calculate water yield and actual evapotranspiration rasters.
 
-    ws_layer.ResetReading()
-    # Iterate over the number of features (polygons)
-    for ws_feat in ws_layer:
-        # Get mean and volume water yield values
-        wyield_mn = ws_feat.GetField('wyield_mn')
-        wyield = ws_feat.GetField('wyield_vol')
+    Both outputs are computed from the same blocks of ``fractp_path`` and
+    ``precip_path``, so the inputs are only read once.
 
-        # Get water demand/consumption values
-        consump_vol = ws_feat.GetField('consum_vol')
-        consump_mn = ws_feat.GetField('consum_mn')
+    Args:
+        fractp_path (string): path to the fractp raster.
+        precip_path (string): path to the precipitation raster (mm). Must
+            be aligned with ``fractp_path``.
+        precip_nodata (float): nodata value from the precip raster.
+        output_nodata (float): nodata value of ``fractp_path`` and of the
+            target rasters.
+        target_wyield_path (string): path to the water yield raster (mm)
+            created by this function.
+        target_aet_path (string): path to the actual evapotranspiration
+            raster (mm) created by this function.
+        n_workers (int): the number of worker processes to compute blocks
+            in.  Blocks are computed in this process if less than 2.
 
-        # Calculate realized supply
-        # these values won't exist if the polygon feature only
-        # covers nodata raster values, so check before doing math.
-        if wyield_mn is not None and consump_mn is not None:
-            rsupply_vol = wyield - consump_vol
-            rsupply_mn = wyield_mn - consump_mn
+    Returns:
+        None
+
+    """
+    _calculate_blocks(
+        _wyield_and_aet_block_op, (precip_nodata, output_nodata),
+        [fractp_path, precip_path], [target_wyield_path, target_aet_path],
+        output_nodata, n_workers)
 
-            # Set values for the new rsupply fields
-            ws_feat.SetField(rsupply_vol_name, rsupply_vol)
-            ws_feat.SetField(rsupply_mn_name, rsupply_mn)
 
-            ws_layer.SetFeature(ws_feat)
+def _wyield_and_aet_block_op(
+        precip_nodata, output_nodata, base_band_list, block_info):
+    """Calculate one block of the water yield and AET rasters.
 
+    Args:
+        precip_nodata (float): nodata value from the precip raster.
+        output_nodata (float): nodata value of the fractp band and of the
+            results.
+        base_band_list (list): the fractp and precipitation bands.
+        block_info (dict): the block's offset and size, as returned by
+            ``pygeoprocessing.iterblocks``.
 
-def compute_water_yield_volume(watershed_results_vector_path):
-    """Calculate the water yield volume per sub-watershed or watershed.
+    Returns:
+        A (wyield, aet) tuple of float32 arrays.
 
-    Results are added to a 'wyield_vol' field in
-    `watershed_results_vector_path`. Units are cubic meters.
+    """
+    fractp_band, precip_band = base_band_list
+    fractp_block = fractp_band.ReadAsArray(**block_info).astype(
+        numpy.float32, copy=False)
+    # Blocks where fractp is all nodata are nodata in both results, so
+    # don't read the precipitation for them.
+    if (fractp_block == output_nodata).all():
+        return tuple(
+            numpy.full(fractp_block.shape, output_nodata, dtype=numpy.float32)
+            for _ in range(2))
+    precip_block, = _as_kernel_arrays(
+        [precip_band.ReadAsArray(**block_info)])
+    wyield_block = numpy.empty(fractp_block.shape, dtype=numpy.float32)
+    aet_block = numpy.empty(fractp_block.shape, dtype=numpy.float32)
+    hydropower_water_yield_core.calculate_wyield_and_aet(
+        fractp_block, precip_block, precip_nodata, output_nodata,
+        wyield_block, aet_block)
+    return wyield_block, aet_block
+
+
+def _as_kernel_arrays(array_list):
+    """Cast raster blocks to the float type of the compiled kernels.
+
+    The blocks are cast to float32 if all of their values can be represented
+    exactly in float32, otherwise to float64.  Blocks that already have that
+    type are not copied.
 
     Args:
-        watershed_results_vector_path (str): Path to a sub-watershed
-            or watershed vector. This vector's features should have a
-            'wyield_mn' attribute.
+        array_list (list): numpy arrays read from rasters.
 
     Returns:
-        None.
+        A list of the arrays, all of the same float type.
 
     """
-    shape = gdal.OpenEx(
-        watershed_results_vector_path, gdal.OF_VECTOR | gdal.GA_Update)
-    layer = shape.GetLayer()
+    if all(numpy.can_cast(array.dtype, numpy.float32)
+           for array in array_list):
+        float_type = numpy.float32
+    else:
+        float_type = numpy.float64
+    return [array.astype(float_type, copy=False) for array in array_list]
 
-    # The field names for the new attributes
-    vol_name = 'wyield_vol'
 
-    # Add the new field to the shapefile
-    field_defn = ogr.FieldDefn(vol_name, ogr.OFTReal)
-    field_defn.SetWidth(24)
-    field_defn.SetPrecision(11)
-    layer.CreateField(field_defn)
+# The block op, its arguments and the bands opened by each block worker
+# process, see _init_block_worker.
+_WORKER_BLOCK_OP = None
+_WORKER_BLOCK_OP_ARGS = None
+_WORKER_BASE_BAND_LIST = None
 
-    layer.ResetReading()
-    # Iterate over the number of features (polygons) and compute volume
-    for feat in layer:
-        wyield_mn = feat.GetField('wyield_mn')
-        # there won't be a wyield_mn value if the polygon feature only
-        # covers nodata raster values, so check before doing math.
-        if wyield_mn is not None:
-            geom = feat.GetGeometryRef()
-            # Calculate water yield volume,
-            # 1000 is for converting the mm of wyield to meters
-            vol = wyield_mn * geom.Area() / 1000.0
-            # Get the volume field index and add value
-            feat.SetField(vol_name, vol)
-
-            layer.SetFeature(feat)
-
-
-def _add_zonal_stats_dict_to_shape(
-        watershed_results_vector_path,
-        stats_map, field_name, aggregate_field_id):
-    """Add a new field to a shapefile with values from a dictionary.
+
+def _init_block_worker(block_op, block_op_args, base_raster_path_list):
+    """Set up the block op and open the input rasters in a worker process.
+
+    GDAL handles can't be shared between processes, so each worker opens its
+    own read-only handles for the lifetime of the worker.  The block op and
+    its arguments are also passed once per worker here, rather than pickled
+    again for every block.
 
     Args:
-        watershed_results_vector_path (string): a path to a vector whose FIDs
-            correspond with the keys in `stats_map`.
-        stats_map (dict): a dictionary in the format generated by
-            pygeoprocessing.zonal_statistics that contains at least the key
-            value of `aggregate_field_id` per feature id.
-        field_name (str): a string for the name of the new field to add to
-            the target vector.
-        aggregate_field_id (string): one of 'min' 'max' 'sum' 'mean' 'count'
-            or 'nodata_count' as defined by pygeoprocessing.zonal_statistics.
+        block_op (callable): the block op, as for ``_calculate_blocks``.
+        block_op_args (tuple): the arguments passed to ``block_op`` before
+            the bands and block.
+        base_raster_path_list (list): paths to the single band rasters read
+            by the block op.
 
     Returns:
         None
 
     """
-    vector = gdal.OpenEx(
-        watershed_results_vector_path, gdal.OF_VECTOR | gdal.GA_Update)
-    layer = vector.GetLayer()
+    global _WORKER_BLOCK_OP, _WORKER_BLOCK_OP_ARGS, _WORKER_BASE_BAND_LIST
+    # Limit the block cache of each worker so the total doesn't scale up
+    # with the number of workers.
+    gdal.SetCacheMax(_WORKER_GDAL_CACHEMAX)
+    raster_list = [
+        gdal.OpenEx(path, gdal.OF_RASTER) for path in base_raster_path_list]
 
-    # Create the new field
-    field_defn = ogr.FieldDefn(field_name, ogr.OFTReal)
-    field_defn.SetWidth(24)
-    field_defn.SetPrecision(11)
-    layer.CreateField(field_defn)
+    _WORKER_BLOCK_OP = block_op
+    _WORKER_BLOCK_OP_ARGS = block_op_args
+    # Keep a reference to each dataset so that its band stays valid.
+    _WORKER_BASE_BAND_LIST = [
+        (raster, raster.GetRasterBand(1)) for raster in raster_list]
 
-    # Get the number of features (polygons) and iterate through each
-    layer.ResetReading()
-    for feature in layer:
-        feature_fid = feature.GetFID()
-
-        # Using the unique feature ID, index into the
-        # dictionary to get the corresponding value
-        # only write a value if zonal stats found valid pixels in the polygon:
-        if stats_map[feature_fid]['count'] > 0:
-            if aggregate_field_id == 'mean':
-                field_val = float(
-                    stats_map[feature_fid]['sum']) / stats_map[feature_fid]['count']
-            else:
-                field_val = float(stats_map[feature_fid][aggregate_field_id])
 
-            # Set the value for the new field
-            feature.SetField(field_name, field_val)
+def _call_block_op(block_info):
+    """Call the worker's block op on a block with the worker's open bands."""
+    return _WORKER_BLOCK_OP(
+        *_WORKER_BLOCK_OP_ARGS, [band for _, band in _WORKER_BASE_BAND_LIST],
+        block_info)
 
-            layer.SetFeature(feature)
+
+def _calculate_blocks(
+        block_op, block_op_args, base_raster_path_list,
+        target_raster_path_list, target_nodata, n_workers):
+    """Calculate float32 rasters block by block from aligned rasters.
+
+    When ``n_workers`` is at least 2 the blocks are computed in a pool of
+    worker processes that each read the input rasters themselves.  Results
+    are written by this process only, since GeoTIFFs can't be safely written
+    from several processes at once.  Only a few blocks per worker are
+    computed ahead of the one being written, so the results waiting to be
+    written don't pile up in memory if writing is slower than computing.
+
+    Args:
+        block_op (callable): a module-level function called as
+            ``block_op(*block_op_args, base_band_list, block_info)`` that
+            returns one array per target raster.
+        block_op_args (tuple): picklable arguments passed to ``block_op``
+            before the bands and block.
+        base_raster_path_list (list): paths to aligned single band rasters
+            whose bands are passed to ``block_op``, in the same order.  The
+            blocks are those of the first raster.
+        target_raster_path_list (list): paths to the float32 rasters created
+            by this function, in the order of the arrays ``block_op``
+            returns.
+        target_nodata (float): the nodata value of the target rasters.
+        n_workers (int): the number of worker processes to compute blocks
+            in.  Blocks are computed in this process if less than 2.
+
+    Returns:
+        None
+
+    """
+    target_raster_list = []
+    target_band_list = []
+    for target_path in target_raster_path_list:
+        pygeoprocessing.new_raster_from_base(
+            base_raster_path_list[0], target_path, gdal.GDT_Float32,
+            [target_nodata])
+        target_raster = gdal.OpenEx(
+            target_path, gdal.OF_RASTER | gdal.GA_Update)
+        target_raster_list.append(target_raster)
+        target_band_list.append(target_raster.GetRasterBand(1))
+
+    def _write_block(block_info, block_result):
+        for target_band, target_block in zip(target_band_list, block_result):
+            target_band.WriteArray(
+                target_block, xoff=block_info['xoff'],
+                yoff=block_info['yoff'])
+
+    block_info_iter = pygeoprocessing.iterblocks(
+        (base_raster_path_list[0], 1), offset_only=True)
+    if n_workers < 2:
+        base_raster_list = [
+            gdal.OpenEx(path, gdal.OF_RASTER)
+            for path in base_raster_path_list]
+        base_band_list = [
+            raster.GetRasterBand(1) for raster in base_raster_list]
+        for block_info in block_info_iter:
+            _write_block(block_info, block_op(
+                *block_op_args, base_band_list, block_info))
+        base_band_list = None
+        base_raster_list = None
+    else:
+        # GDAL's global state isn't safe to fork, so start fresh workers.
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=n_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_block_worker,
+                initargs=(block_op, block_op_args,
+                          base_raster_path_list)) as executor:
+            pending_futures = collections.deque()
+            for block_info in block_info_iter:
+                pending_futures.append(
+                    (block_info, executor.submit(_call_block_op, block_info)))
+                if len(pending_futures) > 2 * n_workers:
+                    block_info, future = pending_futures.popleft()
+                    _write_block(block_info, future.result())
+            while pending_futures:
+                block_info, future = pending_futures.popleft()
+                _write_block(block_info, future.result())
+
+    target_band_list = None
+    target_raster_list = None
+
+
+def compute_hydropower_valuation(val_arrays, rsupply_vl):
+    """Compute the energy production and net present value of watersheds.
+
+    Args:
+        val_arrays (dict): arrays of the valuation parameters of the
+            watersheds, keyed by the valuation table's column names.
+        rsupply_vl (numpy.ndarray): the realized water supply volume of the
+            watersheds (m^3).
+
+    Returns:
+        A tuple of arrays of the hydropower energy production (KWH) and its
+        net present value.
+
+    """
+    # Compute hydropower energy production (KWH)
+    # This is from the equation given in the Users' Guide
+    energy = (
+        val_arrays['efficiency'] * val_arrays['fraction'] *
+        val_arrays['height'] * rsupply_vl * 0.00272)
+
+    # Divide by 100 because it is input at a percent and we need
+    # decimal value
+    disc = val_arrays['discount'] / 100.0
+    # To calculate the summation of the discount rate term over the life
+    # span of the dam we can use a geometric series, which is 0 where the
+    # ratio is 1.
+    ratio = 1. / (1. + disc)
+    dsum = numpy.zeros(ratio.shape, dtype=numpy.float64)
+    numpy.divide(
+        1. - numpy.power(ratio, val_arrays['time_span']), 1. - ratio,
+        out=dsum, where=ratio != 1.)
+
+    npv = ((val_arrays['kw_price'] * energy) - val_arrays['cost']) * dsum
+    return energy, npv
 
 
 @validation.invest_validator
@@ -0,0 +1,269 @@
+# cython: profile=False
+# cython: language_level=3
+import numpy
+cimport numpy
+cimport cython
+cimport libc.math as cmath
+
+
+cdef inline int is_close(double x, double y):
+    return abs(x-y) <= (1e-8+1e-05*abs(y))
+
+
+# Raster values are passed in as float32 when they can be represented
+# exactly, to halve the memory traffic, and as double otherwise.
+ctypedef fused real_t:
+    float
+    double
+
+
+# veg value of landcover classes that are nodata
+VEG_NODATA = 255
+cdef numpy.uint8_t _VEG_NODATA = VEG_NODATA
+
+
+# flags of the landcover classes whose lookup values are valid for PET and
+# for fractp
+cdef enum:
+    PET_VALID = 1
+    FRACTP_VALID = 2
+
+
+@cython.boundscheck(False)  # Deactivate bounds checking
+@cython.wraparound(False)   # Deactivate negative indexing.
+@cython.cdivision(True)     # precip is nonzero wherever we divide by it.
+def calculate_fractp_and_pet(
+        numpy.intp_t[:, :] lulc_index, float[:] kc_lut, float[:] root_lut,
+        numpy.uint8_t[:] veg_lut, real_t[:, :] eto, real_t[:, :] precip,
+        real_t[:, :] soil, real_t[:, :] pawc, double out_nodata, eto_nodata,
+        precip_nodata, depth_root_nodata, pawc_nodata,
+        double seasonality_constant, float[:, :] target_fractp,
+        float[:, :] target_pet):
+    """Calculate AET fraction of precipitation and PET in a single pass.
+
+    The Kc, root depth and vegetation values of each pixel are looked up
+    from its landcover class, so no intermediate rasters of those values
+    are needed.  All 2D arrays must have the same shape, and ``eto``,
+    ``precip``, ``soil`` and ``pawc`` the same float type.
+    ``target_fractp`` and ``target_pet`` are filled in place.
+
+    Args:
+        lulc_index (numpy.ndarray): index of each pixel's landcover class in
+            the lookup arrays.
+        kc_lut (numpy.ndarray): Kc (plant evapotranspiration coefficient)
+            value of each landcover class, or ``out_nodata``.
+        root_lut (numpy.ndarray): root depth (mm) of each landcover class,
+            or ``out_nodata``.
+        veg_lut (numpy.ndarray): uint8 array that's 1 where the landcover
+            class is vegetation, 0 otherwise, or ``VEG_NODATA``.
+        eto (numpy.ndarray): reference evapotranspiration values (mm).
+        precip (numpy.ndarray): precipitation values (mm).
+        soil (numpy.ndarray): depth to root restricted layer values (mm).
+        pawc (numpy.ndarray): plant available water content values.
+        out_nodata (float): nodata value of the lookup arrays and of the
+            targets.
+        eto_nodata (float or None): nodata value of ``eto``.
+        precip_nodata (float or None): nodata value of ``precip``.
+        depth_root_nodata (float or None): nodata value of ``soil``.
+        pawc_nodata (float or None): nodata value of ``pawc``.
+        seasonality_constant (float): floating point value between 1 and 30
+            corresponding to the seasonal distribution of precipitation.
+        target_fractp (numpy.ndarray): float32 array to fill with the
+            actual evapotranspiration fraction of precipitation.
+        target_pet (numpy.ndarray): float32 array to fill with the plant
+            potential evapotranspiration (mm), Kc * ETo.
+
+    Returns:
+        None
+
+    """
+    cdef int row, col
+    cdef numpy.intp_t lut_index
+    cdef int n_rows = target_fractp.shape[0]
+    cdef int n_cols = target_fractp.shape[1]
+    cdef double kc_val, root_val, eto_val, precip_val
+    cdef double pet, phi, awc, climate_w, aet_p
+
+    # resolve the optional nodata values once rather than per pixel
+    cdef int has_eto_nodata = eto_nodata is not None
+    cdef int has_precip_nodata = precip_nodata is not None
+    cdef int has_depth_root_nodata = depth_root_nodata is not None
+    cdef int has_pawc_nodata = pawc_nodata is not None
+    cdef double eto_nodata_val = eto_nodata if has_eto_nodata else 0.0
+    cdef double precip_nodata_val = (
+        precip_nodata if has_precip_nodata else 0.0)
+    cdef double depth_root_nodata_val = (
+        depth_root_nodata if has_depth_root_nodata else 0.0)
+    cdef double pawc_nodata_val = pawc_nodata if has_pawc_nodata else 0.0
+
+    # check the lookup values for nodata once per landcover class rather
+    # than once per pixel
+    cdef numpy.uint8_t[:] class_flags = numpy.zeros(
+        kc_lut.shape[0], dtype=numpy.uint8)
+    for lut_index in range(kc_lut.shape[0]):
+        if is_close(kc_lut[lut_index], out_nodata):
+            continue
+        class_flags[lut_index] = PET_VALID
+        if not (is_close(root_lut[lut_index], out_nodata) or
+                veg_lut[lut_index] == _VEG_NODATA):
+            class_flags[lut_index] |= FRACTP_VALID
+
+    for row in range(n_rows):
+        for col in range(n_cols):
+            target_fractp[row, col] = out_nodata
+            target_pet[row, col] = out_nodata
+
+            lut_index = lulc_index[row, col]
+            eto_val = eto[row, col]
+            if (not (class_flags[lut_index] & PET_VALID) or (
+                    has_eto_nodata and is_close(eto_val, eto_nodata_val))):
+                continue
+            kc_val = kc_lut[lut_index]
+            pet = kc_val * eto_val
+            target_pet[row, col] = pet
+
+            if not (class_flags[lut_index] & FRACTP_VALID):
+                continue
+            # Evaluate every input's nodata test and combine them with
+            # bitwise ors so there's one branch rather than one per input.
+            precip_val = precip[row, col]
+            if (is_close(precip_val, 0.0) |
+                    (has_precip_nodata &
+                     is_close(precip_val, precip_nodata_val)) |
+                    (has_depth_root_nodata &
+                     is_close(soil[row, col], depth_root_nodata_val)) |
+                    (has_pawc_nodata &
+                     is_close(pawc[row, col], pawc_nodata_val))):
+                continue
+            root_val = root_lut[lut_index]
+
+            if veg_lut[lut_index] == 1:
+                # Compute Budyko Dryness index
+                phi = pet / precip_val
+
+                # Calculate plant available water content (mm) using the
+                # minimum of soil depth and root depth
+                awc = min(root_val, soil[row, col]) * pawc[row, col]
+                # Capping to 5.0 to set to upper limit if exceeded
+                climate_w = min(
+                    ((awc / precip_val) * seasonality_constant) + 1.25, 5.0)
+
+                # Compute evapotranspiration partition of the water balance,
+                # (1 + phi) - (1 + phi^w)^(1/w), with exp and log rather than
+                # pow.  log1p keeps the precision of small phi^w.
+                aet_p = (1.0 + phi) - cmath.exp(cmath.log1p(
+                    cmath.exp(climate_w * cmath.log(phi))) / climate_w)
+
+                # We take the minimum of the following values (phi, aet_p)
+                # to determine the evapotranspiration partition of the
+                # water balance (see users guide)
+                target_fractp[row, col] = min(phi, aet_p)
+            else:
+                # If not vegetation (wetlands, urban, water, etc...) use
+                # alternative equation Kc * Eto.  Take the minimum of precip
+                # and Kc * ETo to avoid x / p > 1.0
+                target_fractp[row, col] = min(precip_val, pet) / precip_val
+
+
+@cython.boundscheck(False)  # Deactivate bounds checking
+@cython.wraparound(False)   # Deactivate negative indexing.
+def calculate_wyield_and_aet(
+        float[:, :] fractp, real_t[:, :] precip, precip_nodata,
+        double out_nodata, float[:, :] target_wyield,
+        float[:, :] target_aet):
+    """Calculate water yield and actual evapotranspiration in one pass.
+
+    Args:
+        fractp (numpy.ndarray): actual evapotranspiration fraction of
+            precipitation.  Nodata pixels have the value ``out_nodata``.
+        precip (numpy.ndarray): precipitation values (mm).
+        precip_nodata (float or None): nodata value of ``precip``.
+        out_nodata (float): nodata value of ``fractp``, ``target_wyield`` and
+            ``target_aet``.
+        target_wyield (numpy.ndarray): float32 array to fill with water yield
+            values (mm).
+        target_aet (numpy.ndarray): float32 array to fill with actual
+            evapotranspiration values (mm).
+
+    Returns:
+        None
+
+    """
+    cdef int row, col
+    cdef int n_rows = fractp.shape[0]
+    cdef int n_cols = fractp.shape[1]
+    cdef double fractp_val, precip_val
+    cdef int has_precip_nodata = precip_nodata is not None
+    cdef double precip_nodata_val = (
+        precip_nodata if has_precip_nodata else 0.0)
+
+    for row in range(n_rows):
+        for col in range(n_cols):
+            target_wyield[row, col] = out_nodata
+            target_aet[row, col] = out_nodata
+
+            # a pixel that's nodata in either input is nodata in both
+            # outputs, so test it once for both
+            precip_val = precip[row, col]
+            fractp_val = fractp[row, col]
+            if (is_close(fractp_val, out_nodata) |
+                    (has_precip_nodata &
+                     is_close(precip_val, precip_nodata_val))):
+                continue
+
+            target_wyield[row, col] = (1.0 - fractp_val) * precip_val
+            # checking if fractp >= 0 because it's a value that's between 0
+            # and 1 and the nodata value is negative.
+            if fractp_val >= 0:
+                target_aet[row, col] = fractp_val * precip_val
+
+
+@cython.boundscheck(False)  # Deactivate bounds checking
+@cython.wraparound(False)   # Deactivate negative indexing.
+def accumulate_zonal_stats(
+        numpy.int32_t[:, :] zone_block, real_t[:, :] value_block,
+        value_nodata, numpy.int64_t[:] count, numpy.int64_t[:] nodata_count,
+        double[:] value_sum, double[:] value_min, double[:] value_max):
+    """Add the pixels of a block to running per-zone statistics.
+
+    The statistics arrays are indexed by zone and updated in place.
+
+    Args:
+        zone_block (numpy.ndarray): int32 array of zone indexes.  Pixels
+            outside of any zone have a negative value.
+        value_block (numpy.ndarray): values to aggregate, with the same shape
+            as ``zone_block``.
+        value_nodata (float or None): nodata value of ``value_block``.  Nodata
+            pixels are only counted in ``nodata_count``.
+        count (numpy.ndarray): int64 count of valid pixels per zone.
+        nodata_count (numpy.ndarray): int64 count of nodata pixels per zone.
+        value_sum (numpy.ndarray): sum of valid pixel values per zone.
+        value_min (numpy.ndarray): minimum valid pixel value per zone.
+        value_max (numpy.ndarray): maximum valid pixel value per zone.
+
+    Returns:
+        None
+
+    """
+    cdef int row, col, zone
+    cdef int n_rows = zone_block.shape[0]
+    cdef int n_cols = zone_block.shape[1]
+    cdef double value
+    cdef int has_value_nodata = value_nodata is not None
+    cdef double value_nodata_val = value_nodata if has_value_nodata else 0.0
+
+    for row in range(n_rows):
+        for col in range(n_cols):
+            zone = zone_block[row, col]
+            if zone < 0:
+                continue
+            value = value_block[row, col]
+            if has_value_nodata and is_close(value, value_nodata_val):
+                nodata_count[zone] += 1
+                continue
+            count[zone] += 1
+            value_sum[zone] += value
+            if value < value_min[zone]:
+                value_min[zone] = value
+            if value > value_max[zone]:
+                value_max[zone] = value
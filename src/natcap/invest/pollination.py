@@ -1038,10 +1038,8 @@ def _parse_scenario_variables(args):
             farm_layer = None
             farm_vector = None
             raise ValueError("Farm layer not a polygon type")
-        farm_layer_defn = farm_layer.GetLayerDefn()
         farm_headers = [
-            farm_layer_defn.GetFieldDefn(i).GetName()
-            for i in range(farm_layer_defn.GetFieldCount())]
+            field_defn.GetName() for field_defn in farm_layer.schema]
         for header in _EXPECTED_FARM_HEADERS:
             matches = re.findall(header, " ".join(farm_headers))
             if not matches:
@@ -401,23 +401,17 @@ def extract_datasource_table_by_key(datasource_uri, key_field):
     # Pull apart the datasource
     datasource = gdal.OpenEx(datasource_uri)
     layer = datasource.GetLayer()
-    layer_def = layer.GetLayerDefn()
-
-    # Build up a list of field names for the datasource table
-    field_names = []
-    for field_id in range(layer_def.GetFieldCount()):
-        field_def = layer_def.GetFieldDefn(field_id)
-        field_names.append(field_def.GetName())
+    # Only the attribute table is needed, so don't read the geometries.
+    layer.SetIgnoredFields(['OGR_GEOMETRY'])
 
     # Loop through each feature and build up the dictionary representing the
-    # attribute table
+    # attribute table.  Feature.items() reads all of a feature's fields at
+    # once, keyed by field name.
     attribute_dictionary = {}
     for feature in layer:
-        feature_fields = {}
-        for field_name in field_names:
-            feature_fields[field_name] = feature.GetField(field_name)
-        key_value = feature.GetField(key_field)
-        attribute_dictionary[key_value] = feature_fields
+        feature_fields = feature.items()
+        # GetField matches key_field case-insensitively, as OGR does.
+        attribute_dictionary[feature.GetField(key_field)] = feature_fields
 
     # Explictly clean up the layers so the files close
     layer = None
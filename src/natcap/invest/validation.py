@@ -1,5 +1,7 @@
 """Common validation utilities for InVEST models."""
 import ast
+import collections
+import concurrent.futures
 import inspect
 import logging
 import pprint
@@ -25,6 +27,20 @@ CHECK_ALL_KEYS = None
 MESSAGE_REQUIRED = 'Parameter is required but is missing or has no value'
 LOGGER = logging.getLogger(__name__)
 
+# The most args validated at the same time, each in its own thread.
+_MAX_VALIDATION_THREADS = 4
+
+# The most raster and vector validation results that are cached.
+_MAX_CACHED_DATASETS = 512
+
+# The files of recently opened datasets, as listed by GDAL when they were
+# opened, least recently used first.
+_DATASET_FILE_LISTS = collections.OrderedDict()
+_DATASET_FILE_LISTS_LOCK = threading.Lock()
+
+# Marks an arg whose validation function raised an exception.
+_UNEXPECTED_ERROR = object()
+
 
 WORKSPACE_SPEC = {
     "name": "Workspace",
@@ -242,6 +258,76 @@ def check_permissions(path, permissions):
             return 'You must have %s access to this file' % descriptor
 
 
+def _dataset_signature(filepath):
+    """Describe the on-disk state of a dataset for use as a cache key.
+
+    A GDAL dataset may be spread over several files (a shapefile's ``.prj``
+    and ``.dbf``, a raster's ``.aux.xml`` or ``.ovr``), so every file that
+    GDAL listed for the dataset when it was last opened is included.  Those
+    are only the files that existed then, so the modification time of the
+    dataset's directory is included as well: it changes when a file such as
+    a missing ``.prj`` is added next to the dataset.
+
+    Args:
+        filepath (string): The path to a file that exists on disk.
+
+    Returns:
+        A tuple of the directory's ``(path, mtime_ns)`` followed by a
+        ``(path, mtime_ns, ctime_ns, size)`` tuple for each file, or ``None``
+        if the dataset should not be cached.  Directory datasets (such as an
+        ESRI Grid or a File Geodatabase) and VRTs may change without any of
+        their listed files changing, so they are never cached.
+
+    """
+    if (os.path.isdir(filepath) or
+            os.path.splitext(filepath)[1].lower() == '.vrt'):
+        return None
+
+    with _DATASET_FILE_LISTS_LOCK:
+        if filepath in _DATASET_FILE_LISTS:
+            _DATASET_FILE_LISTS.move_to_end(filepath)
+            file_list = _DATASET_FILE_LISTS[filepath]
+        else:
+            file_list = (filepath,)
+
+    dirname = os.path.dirname(os.path.abspath(filepath))
+    signature = [(dirname, os.stat(dirname).st_mtime_ns)]
+    for path in file_list:
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            # A file of the dataset was removed.
+            signature.append((path, None, None, None))
+            continue
+        signature.append((
+            path, stat_result.st_mtime_ns, stat_result.st_ctime_ns,
+            stat_result.st_size))
+    return tuple(signature)
+
+
+def _record_dataset_files(filepath, gdal_dataset):
+    """Remember the files of a dataset for ``_dataset_signature``.
+
+    Only the ``_MAX_CACHED_DATASETS`` most recently used datasets are
+    remembered, like the cached validation results.
+
+    Args:
+        filepath (string): The path the dataset was opened from.
+        gdal_dataset (gdal.Dataset): The open dataset.
+
+    Returns:
+        None
+
+    """
+    file_list = gdal_dataset.GetFileList()
+    if file_list:
+        with _DATASET_FILE_LISTS_LOCK:
+            _DATASET_FILE_LISTS[filepath] = tuple(file_list)
+            _DATASET_FILE_LISTS.move_to_end(filepath)
+            if len(_DATASET_FILE_LISTS) > _MAX_CACHED_DATASETS:
+                _DATASET_FILE_LISTS.popitem(last=False)
+
+
 def _check_projection(srs, projected, projection_units):
     """Validate a GDAL projection.
 
@@ -301,12 +387,43 @@ def check_raster(filepath, projected=False, projection_units=None):
     if file_warning:
         return file_warning
 
+    signature = _dataset_signature(filepath)
+    if signature is None:
+        return _check_raster_dataset.__wrapped__(
+            filepath, signature, projected, projection_units)
+    return _check_raster_dataset(
+        filepath, signature, projected, projection_units)
+
+
+@functools.lru_cache(maxsize=_MAX_CACHED_DATASETS)
+def _check_raster_dataset(filepath, signature, projected, projection_units):
+    """Open and validate a GDAL raster that is known to exist.
+
+    Results are cached so that revalidating an unchanged raster does not
+    reopen it with GDAL.
+
+    Args:
+        filepath (string): The path to the raster on disk.
+        signature (tuple): The ``_dataset_signature`` of ``filepath``.  Only
+            used as part of the cache key.  ``None`` if the result is not
+            cached.
+        projected (bool): Whether the spatial reference must be projected
+            in linear units.
+        projection_units (string): The string label (case-insensitive)
+            indicating the required linear units of the projection, or
+            ``None``.
+
+    Returns:
+        A string error message if an error was found.  ``None`` otherwise.
+
+    """
     gdal.PushErrorHandler('CPLQuietErrorHandler')
     gdal_dataset = gdal.OpenEx(filepath, gdal.OF_RASTER)
     gdal.PopErrorHandler()
 
     if gdal_dataset is None:
         return "File could not be opened as a GDAL raster"
+    _record_dataset_files(filepath, gdal_dataset)
     # Check that an overview .ovr file wasn't opened.
     if os.path.splitext(filepath)[1] == '.ovr':
         return "File found to be an overview '.ovr' file."
@@ -373,12 +490,49 @@ def check_vector(filepath, required_fields=None, projected=False,
     if file_warning:
         return file_warning
 
+    if required_fields is not None:
+        required_fields = tuple(required_fields)
+    signature = _dataset_signature(filepath)
+    if signature is None:
+        return _check_vector_dataset.__wrapped__(
+            filepath, signature, required_fields, projected,
+            projection_units)
+    return _check_vector_dataset(
+        filepath, signature, required_fields, projected, projection_units)
+
+
+@functools.lru_cache(maxsize=_MAX_CACHED_DATASETS)
+def _check_vector_dataset(filepath, signature, required_fields, projected,
+                          projection_units):
+    """Open and validate a GDAL vector that is known to exist.
+
+    Results are cached so that revalidating an unchanged vector does not
+    reopen it with GDAL.
+
+    Args:
+        filepath (string): The path to the vector on disk.
+        signature (tuple): The ``_dataset_signature`` of ``filepath``.  Only
+            used as part of the cache key.  ``None`` if the result is not
+            cached.
+        required_fields (tuple): The string fieldnames (case-insensitive)
+            that must be present in the vector layer's table, or ``None``.
+        projected (bool): Whether the spatial reference must be projected
+            in linear units.
+        projection_units (string): The string label (case-insensitive)
+            indicating the required linear units of the projection, or
+            ``None``.
+
+    Returns:
+        A string error message if an error was found.  ``None`` otherwise.
+
+    """
     gdal.PushErrorHandler('CPLQuietErrorHandler')
     gdal_dataset = gdal.OpenEx(filepath, gdal.OF_VECTOR)
     gdal.PopErrorHandler()
 
     if gdal_dataset is None:
         return "File could not be opened as a GDAL vector"
+    _record_dataset_files(filepath, gdal_dataset)
 
     layer = gdal_dataset.GetLayer()
     srs = layer.GetSpatialRef()
@@ -793,6 +947,7 @@ def validate(args, spec, spatial_overlap_opts=None):
     # because a checkbox is unchecked.
     invalid_keys = set()
     sufficient_keys = set(args.keys()).difference(insufficient_keys)
+    key_validation_list = []
     for key in sufficient_keys.difference(excluded_keys):
         # Extra args that don't exist in the ARGS_SPEC are okay
         # we don't need to try to validate them
@@ -810,20 +965,37 @@ def validate(args, spec, spatial_overlap_opts=None):
         if type_validation_func is None:
             # Validation for 'other' type must be performed by the user.
             continue
+        key_validation_list.append(
+            (key, type_validation_func, validation_options))
 
+    def _validate_key(key_validation):
+        key, type_validation_func, validation_options = key_validation
         try:
-            warning_msg = type_validation_func(
-                args[key], **validation_options)
-
-            if warning_msg:
-                validation_warnings.append(([key], warning_msg))
-                invalid_keys.add(key)
+            return type_validation_func(args[key], **validation_options)
         except Exception:
             LOGGER.exception(
                 'Error when validating key %s with value %s',
                 key, args[key])
-            validation_warnings.append(
-                ([key], 'An unexpected error occurred in validation'))
+            return _UNEXPECTED_ERROR
+
+    # The file checks each open their file (and may wait on a slow file
+    # streaming service), so they are run alongside each other rather than
+    # one after another.
+    if key_validation_list:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(
+                    _MAX_VALIDATION_THREADS,
+                    len(key_validation_list))) as executor:
+            warning_msg_list = list(
+                executor.map(_validate_key, key_validation_list))
+        for (key, _, _), warning_msg in zip(
+                key_validation_list, warning_msg_list):
+            if warning_msg is _UNEXPECTED_ERROR:
+                validation_warnings.append(
+                    ([key], 'An unexpected error occurred in validation'))
+            elif warning_msg:
+                validation_warnings.append(([key], warning_msg))
+                invalid_keys.add(key)
     # step 5: check spatial overlap if applicable
     if spatial_overlap_opts:
         spatial_keys = set(spatial_overlap_opts['spatial_keys'])
@@ -427,3 +427,23 @@ class CLIUnitTests(unittest.TestCase):
         module = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(module)
         self.assertEqual(module.args, expected_args)
+
+    def test_export_to_python_braces_in_args(self):
+        """Export a python script w/ braces in the arg values."""
+        from natcap.invest import cli
+
+        target_filepath = os.path.join(self.workspace_dir, 'foo.py')
+        target_model = 'carbon'
+        expected_args = {
+            'workspace_dir': 'my{workspace}',
+            'results_suffix': '}{',
+        }
+        cli.export_to_python(
+            target_filepath,
+            target_model, expected_args)
+
+        module_name = str(uuid.uuid4()) + 'testscript'
+        spec = importlib.util.spec_from_file_location(module_name, target_filepath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self.assertEqual(module.args, expected_args)
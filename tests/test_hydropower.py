@@ -4,9 +4,13 @@ import tempfile
 import shutil
 import os
 
+from osgeo import gdal
+from osgeo import ogr
+from osgeo import osr
 import pandas
 import numpy
 import pygeoprocessing
+import shapely.geometry
 
 SAMPLE_DATA = os.path.join(
     os.path.dirname(__file__), '..', 'data', 'invest-test-data', 'hydropower',
@@ -15,6 +19,83 @@ REGRESSION_DATA = os.path.join(
     os.path.dirname(__file__), '..', 'data', 'invest-test-data', 'hydropower')
 
 
+def _reference_fractp_op(
+        Kc, eto, precip, root, soil, pawc, veg, nodata_dict,
+        seasonality_constant):
+    """Calculate fractp with the numpy formulas of InVEST 3.9.0."""
+    valid_mask = (
+        ~numpy.isclose(Kc, nodata_dict['out_nodata']) &
+        ~numpy.isclose(root, nodata_dict['out_nodata']) &
+        ~numpy.isclose(veg, nodata_dict['out_nodata']) &
+        ~numpy.isclose(precip, 0.0))
+    if nodata_dict['eto'] is not None:
+        valid_mask &= ~numpy.isclose(eto, nodata_dict['eto'])
+    if nodata_dict['precip'] is not None:
+        valid_mask &= ~numpy.isclose(precip, nodata_dict['precip'])
+    if nodata_dict['depth_root'] is not None:
+        valid_mask &= ~numpy.isclose(soil, nodata_dict['depth_root'])
+    if nodata_dict['pawc'] is not None:
+        valid_mask &= ~numpy.isclose(pawc, nodata_dict['pawc'])
+
+    phi = (Kc[valid_mask] * eto[valid_mask]) / precip[valid_mask]
+    pet = Kc[valid_mask] * eto[valid_mask]
+    awc = numpy.where(
+        root[valid_mask] < soil[valid_mask], root[valid_mask],
+        soil[valid_mask]) * pawc[valid_mask]
+    climate_w = (
+        (awc / precip[valid_mask]) * seasonality_constant) + 1.25
+    climate_w[climate_w > 5.0] = 5.0
+    aet_p = (
+        1.0 + (pet / precip[valid_mask])) - (
+            (1.0 + (pet / precip[valid_mask]) ** climate_w) ** (
+                1.0 / climate_w))
+    veg_result = numpy.where(phi < aet_p, phi, aet_p)
+    nonveg_result = Kc[valid_mask] * eto[valid_mask]
+    nonveg_mask = precip[valid_mask] < Kc[valid_mask] * eto[valid_mask]
+    nonveg_result[nonveg_mask] = precip[valid_mask][nonveg_mask]
+    nonveg_result_fract = nonveg_result / precip[valid_mask]
+    result = numpy.where(
+        veg[valid_mask] == 1.0, veg_result, nonveg_result_fract)
+
+    fractp = numpy.empty(valid_mask.shape, dtype=numpy.float32)
+    fractp[:] = nodata_dict['out_nodata']
+    fractp[valid_mask] = result
+    return fractp
+
+
+def _reference_pet_op(eto_pix, Kc_pix, eto_nodata, output_nodata):
+    """Calculate PET with the numpy formula of InVEST 3.9.0."""
+    result = numpy.empty(eto_pix.shape, dtype=numpy.float32)
+    result[:] = output_nodata
+    valid_mask = ~numpy.isclose(Kc_pix, output_nodata)
+    if eto_nodata is not None:
+        valid_mask &= ~numpy.isclose(eto_pix, eto_nodata)
+    result[valid_mask] = eto_pix[valid_mask] * Kc_pix[valid_mask]
+    return result
+
+
+def _reference_wyield_op(fractp, precip, precip_nodata, output_nodata):
+    """Calculate water yield with the numpy formula of InVEST 3.9.0."""
+    result = numpy.empty_like(fractp)
+    result[:] = output_nodata
+    valid_mask = ~numpy.isclose(fractp, output_nodata)
+    if precip_nodata is not None:
+        valid_mask &= ~numpy.isclose(precip, precip_nodata)
+    result[valid_mask] = (1.0 - fractp[valid_mask]) * precip[valid_mask]
+    return result
+
+
+def _reference_aet_op(fractp, precip, precip_nodata, output_nodata):
+    """Calculate AET with the numpy formula of InVEST 3.9.0."""
+    result = numpy.empty_like(fractp)
+    result[:] = output_nodata
+    valid_mask = fractp >= 0
+    if precip_nodata is not None:
+        valid_mask &= ~numpy.isclose(precip, precip_nodata)
+    result[valid_mask] = fractp[valid_mask] * precip[valid_mask]
+    return result
+
+
 class HydropowerTests(unittest.TestCase):
     """Regression Tests for Annual Water Yield Hydropower Model."""
 
@@ -367,3 +448,591 @@ class HydropowerTests(unittest.TestCase):
         self.assertTrue(
             'but are not found in the valuation table' in
             actual_message, actual_message)
+
+
+class HydropowerUnitTests(unittest.TestCase):
+    """Unit tests for the Annual Water Yield helper functions."""
+
+    def setUp(self):
+        """Create a temporary workspace directory."""
+        self.workspace_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary workspace directory."""
+        shutil.rmtree(self.workspace_dir)
+
+    def test_zonal_stats_tofile(self):
+        """Hydro: zonal stats match pygeoprocessing.zonal_statistics."""
+        import pickle
+        from natcap.invest.hydropower import hydropower_water_yield
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        projection_wkt = srs.ExportToWkt()
+
+        value_array = numpy.arange(100, dtype=numpy.float32).reshape(10, 10)
+        value_array[2, 2:5] = -1  # nodata pixels under the first polygon
+        raster_path = os.path.join(self.workspace_dir, 'values.tif')
+        pygeoprocessing.numpy_array_to_raster(
+            value_array, -1, (1, -1), (0, 10), projection_wkt, raster_path)
+        no_nodata_path = os.path.join(self.workspace_dir, 'no_nodata.tif')
+        pygeoprocessing.numpy_array_to_raster(
+            value_array * 2, None, (1, -1), (0, 10), projection_wkt,
+            no_nodata_path)
+
+        vector_path = os.path.join(self.workspace_dir, 'watersheds.shp')
+        pygeoprocessing.shapely_geometry_to_vector(
+            [shapely.geometry.box(0, 0, 6, 6),
+             # overlaps the first polygon
+             shapely.geometry.box(4, 4, 10, 10),
+             # too small to contain any pixel centers
+             shapely.geometry.box(7.6, 1.6, 7.9, 1.9)],
+            vector_path, projection_wkt, 'ESRI Shapefile',
+            fields={'ws_id': ogr.OFTInteger},
+            attribute_list=[{'ws_id': 1}, {'ws_id': 2}, {'ws_id': 3}])
+        # and a feature without a geometry
+        vector = gdal.OpenEx(vector_path, gdal.OF_VECTOR | gdal.GA_Update)
+        layer = vector.GetLayer()
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetField('ws_id', 4)
+        layer.CreateFeature(feature)
+        feature = None
+        layer = None
+        vector = None
+
+        raster_names_paths_list = [
+            ('values', raster_path), ('no_nodata', no_nodata_path)]
+        stats_pickle_path = os.path.join(self.workspace_dir, 'stats.pickle')
+        hydropower_water_yield.zonal_stats_tofile(
+            vector_path, raster_names_paths_list, stats_pickle_path)
+        with open(stats_pickle_path, 'rb') as stats_pickle:
+            stats_dict = pickle.load(stats_pickle)
+
+        # the working directory was removed
+        self.assertEqual(
+            [name for name in os.listdir(self.workspace_dir)
+             if os.path.isdir(os.path.join(self.workspace_dir, name))], [])
+
+        for key_name, path in raster_names_paths_list:
+            expected_stats = pygeoprocessing.zonal_statistics(
+                (path, 1), vector_path)
+            self.assertEqual(
+                sorted(stats_dict[key_name]), sorted(expected_stats))
+            for fid, expected in expected_stats.items():
+                actual = stats_dict[key_name][fid]
+                for stat_name in ('count', 'nodata_count'):
+                    self.assertEqual(
+                        actual[stat_name], expected[stat_name],
+                        (key_name, fid, stat_name))
+                for stat_name in ('min', 'max', 'sum'):
+                    if expected[stat_name] is None:
+                        self.assertIsNone(actual[stat_name])
+                    else:
+                        self.assertAlmostEqual(
+                            actual[stat_name], expected[stat_name],
+                            msg=(key_name, fid, stat_name))
+
+        # the overlapping polygons both count the pixels they share
+        self.assertEqual(stats_dict['no_nodata'][0]['count'], 36)
+        self.assertEqual(stats_dict['no_nodata'][1]['count'], 36)
+
+    def test_get_envelope_window(self):
+        """Hydro: raster window of a bounding box."""
+        from natcap.invest.hydropower import hydropower_water_yield
+
+        geotransform = [0, 1, 0, 10, 0, -1]
+        # (min_x, max_x, min_y, max_y) within the raster
+        self.assertEqual(
+            hydropower_water_yield._get_envelope_window(
+                (2.5, 4.5, 3.5, 6.5), geotransform, 10, 10),
+            {'xoff': 2, 'yoff': 3, 'win_xsize': 3, 'win_ysize': 4})
+        # clamped to the raster's extents
+        self.assertEqual(
+            hydropower_water_yield._get_envelope_window(
+                (-5, 2, 8, 15), geotransform, 10, 10),
+            {'xoff': 0, 'yoff': 0, 'win_xsize': 2, 'win_ysize': 2})
+        # outside of the raster
+        self.assertIsNone(
+            hydropower_water_yield._get_envelope_window(
+                (20, 30, 0, 5), geotransform, 10, 10))
+
+    def test_get_key_index(self):
+        """Hydro: landcover codes' indexes with and without the dense LUT."""
+        from natcap.invest.hydropower import hydropower_water_yield
+
+        error_details = {
+            'raster_name': 'LULC',
+            'column_name': 'lucode',
+            'table_name': 'Biophysical',
+        }
+        int32_max = numpy.iinfo(numpy.int32).max
+        lulc_block = numpy.array(
+            [[1, 2, 5], [5, 2, 1], [2, 2, 2]], dtype=numpy.int32)
+        for lulc_nodata in (None, -1, 0, int32_max):
+            keys = numpy.array([1, 2, 5])
+            nodata_block = lulc_block.copy()
+            if lulc_nodata is not None:
+                keys = numpy.array(sorted([1, 2, 5, lulc_nodata]))
+                nodata_block[0, 0] = lulc_nodata
+            expected_index = numpy.searchsorted(keys, nodata_block)
+
+            # The nodata value is left out of the dense LUT, so it doesn't
+            # stop the LUT being used.
+            key_index_lut = hydropower_water_yield._get_key_index_lut(
+                keys, lulc_nodata)
+            self.assertIsNotNone(key_index_lut)
+            self.assertEqual(key_index_lut.size, 6)
+            numpy.testing.assert_array_equal(
+                hydropower_water_yield._get_key_index(
+                    nodata_block, keys, key_index_lut, lulc_nodata,
+                    error_details),
+                expected_index)
+
+            # float landcover codes are searched for
+            numpy.testing.assert_array_equal(
+                hydropower_water_yield._get_key_index(
+                    nodata_block.astype(numpy.float64), keys, key_index_lut,
+                    lulc_nodata, error_details),
+                expected_index)
+
+            # codes that aren't in the table, on both paths
+            missing_block = nodata_block.copy()
+            missing_block[1, 1] = 3
+            missing_block[2, 2] = 7
+            for block in (missing_block, missing_block.astype(numpy.float64)):
+                with self.assertRaises(ValueError) as cm:
+                    hydropower_water_yield._get_key_index(
+                        block, keys, key_index_lut, lulc_nodata,
+                        error_details)
+                self.assertIn(
+                    "missing values found in the LULC raster but not the"
+                    " table are: [3", str(cm.exception))
+
+        # Negative and non-integer codes can't be looked up in a LUT.
+        for keys in (numpy.array([-2, 1, 2]), numpy.array([1, 2.5])):
+            self.assertIsNone(
+                hydropower_water_yield._get_key_index_lut(keys, None))
+        keys = numpy.array([-2, -1, 1, 2])
+        block = numpy.array([[-2, -1], [1, 2]], dtype=numpy.int32)
+        numpy.testing.assert_array_equal(
+            hydropower_water_yield._get_key_index(
+                block, keys, None, -1, error_details),
+            [[0, 1], [2, 3]])
+
+    def test_calculate_blocks_parallel(self):
+        """Hydro: blocks computed by worker processes match serial blocks."""
+        from natcap.invest.hydropower import hydropower_water_yield
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        projection_wkt = srs.ExportToWkt()
+
+        # Several 256x256 blocks, with partial blocks on the right and
+        # bottom edges.
+        rng = numpy.random.default_rng(seed=1)
+        shape = (600, 700)
+        fractp_array = rng.random(shape, dtype=numpy.float32)
+        # a block that's entirely nodata
+        fractp_array[:300, :300] = -1
+        precip_array = (rng.random(shape) * 1000).astype(numpy.float32)
+        precip_array[::7, ::5] = -9999
+        lulc_array = rng.integers(1, 4, size=shape, dtype=numpy.int32)
+        lulc_array[::3, ::11] = -1
+
+        base_path_map = {}
+        for name, array, nodata in (
+                ('fractp', fractp_array, -1),
+                ('precip', precip_array, -9999),
+                ('lulc', lulc_array, -1)):
+            base_path_map[name] = os.path.join(
+                self.workspace_dir, f'{name}.tif')
+            pygeoprocessing.numpy_array_to_raster(
+                array, nodata, (1, -1), (0, 0), projection_wkt,
+                base_path_map[name])
+
+        error_details = {
+            'raster_name': 'LULC', 'column_name': 'lucode',
+            'table_name': 'Demand'}
+        result_path_map = {}
+        for n_workers in (-1, 2):
+            result_path_map[n_workers] = [
+                os.path.join(self.workspace_dir, f'{name}_{n_workers}.tif')
+                for name in ('wyield', 'aet', 'demand')]
+            wyield_path, aet_path, demand_path = result_path_map[n_workers]
+            hydropower_water_yield.calculate_wyield_and_aet(
+                base_path_map['fractp'], base_path_map['precip'], -9999, -1,
+                wyield_path, aet_path, n_workers)
+            hydropower_water_yield.reclassify_lulc(
+                base_path_map['lulc'], {1: 0.5, 2: 1.5, 3: 2.5}, -1,
+                demand_path, -1, error_details, n_workers)
+
+        for serial_path, parallel_path in zip(
+                result_path_map[-1], result_path_map[2]):
+            numpy.testing.assert_array_equal(
+                pygeoprocessing.raster_to_numpy_array(parallel_path),
+                pygeoprocessing.raster_to_numpy_array(serial_path))
+
+    def test_fractp_and_pet_lulc_nodata_lucode(self):
+        """Hydro: a nodata value that's a lucode keeps its values in blocks."""
+        from natcap.invest.hydropower import hydropower_water_yield
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        projection_wkt = srs.ExportToWkt()
+
+        # Two 256x256 blocks: the left one is entirely the nodata value and
+        # the right one mixes it with another landcover code.
+        shape = (256, 512)
+        lulc_array = numpy.full(shape, 255, dtype=numpy.int32)
+        lulc_array[:, 256::2] = 1
+        base_path_list = []
+        for name, array, nodata in (
+                ('lulc', lulc_array, 255),
+                ('eto', numpy.full(shape, 900, dtype=numpy.float32), -1),
+                ('precip', numpy.full(shape, 1000, dtype=numpy.float32), -1),
+                ('depth', numpy.full(shape, 2000, dtype=numpy.float32), -1),
+                ('pawc', numpy.full(shape, 0.2, dtype=numpy.float32), -1)):
+            base_path_list.append(
+                os.path.join(self.workspace_dir, f'{name}.tif'))
+            pygeoprocessing.numpy_array_to_raster(
+                array, nodata, (1, -1), (0, 0), projection_wkt,
+                base_path_list[-1])
+
+        value_map_list = [
+            {1: 0.7, 255: 1.0}, {1: 1500, 255: 3000}, {1: 1, 255: 1}]
+        nodata_dict = {
+            'lulc': 255, 'eto': -1, 'precip': -1, 'depth_root': -1,
+            'pawc': -1, 'out_nodata': -1}
+        error_details = {
+            'raster_name': 'LULC', 'column_name': 'lucode',
+            'table_name': 'Biophysical'}
+        fractp_path = os.path.join(self.workspace_dir, 'fractp.tif')
+        pet_path = os.path.join(self.workspace_dir, 'pet.tif')
+        lulc_path, eto_path, precip_path, depth_path, pawc_path = (
+            base_path_list)
+        hydropower_water_yield.calculate_fractp_and_pet(
+            lulc_path, value_map_list, eto_path, precip_path, depth_path,
+            pawc_path, nodata_dict, 5, error_details, fractp_path, pet_path)
+
+        for path in (fractp_path, pet_path):
+            array = pygeoprocessing.raster_to_numpy_array(path)
+            nodata_lucode_values = array[lulc_array == 255]
+            self.assertFalse(numpy.any(nodata_lucode_values == -1))
+            numpy.testing.assert_array_equal(
+                nodata_lucode_values, nodata_lucode_values[0])
+        numpy.testing.assert_allclose(
+            pygeoprocessing.raster_to_numpy_array(pet_path)[0, 0], 900)
+
+    def test_execute_parallel(self):
+        """Hydro: model results don't depend on the number of workers."""
+        from natcap.invest.hydropower import hydropower_water_yield
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(32731)  # WGS84/UTM zone 31s
+        projection_wkt = srs.ExportToWkt()
+
+        rng = numpy.random.default_rng(seed=1)
+        shape = (300, 400)
+        lulc_array = rng.integers(1, 4, size=shape, dtype=numpy.int32)
+        lulc_array[:256, :256] = 255  # a block of landcover nodata
+        lulc_array[::7, ::3] = 255
+        input_dir = os.path.join(self.workspace_dir, 'input')
+        os.makedirs(input_dir)
+        pygeoprocessing.numpy_array_to_raster(
+            lulc_array, 255, (30, -30), (0, 9000), projection_wkt,
+            os.path.join(input_dir, 'lulc.tif'))
+        for name, low, high in (
+                ('eto', 600, 1400), ('precip', 300, 2500),
+                ('depth', 200, 3000), ('pawc', 0.05, 0.4)):
+            pygeoprocessing.numpy_array_to_raster(
+                rng.uniform(low, high, shape).astype(numpy.float32), -1,
+                (30, -30), (0, 9000), projection_wkt,
+                os.path.join(input_dir, f'{name}.tif'))
+
+        for name, id_field, geometry_list in (
+                ('watersheds', 'ws_id', [
+                    shapely.geometry.box(0, 0, 6000, 9000),
+                    shapely.geometry.box(6000, 0, 12000, 9000)]),
+                ('subwatersheds', 'subws_id', [
+                    shapely.geometry.box(0, 3000, 9000, 9000),
+                    shapely.geometry.box(3000, 0, 12000, 6000)])):
+            pygeoprocessing.shapely_geometry_to_vector(
+                geometry_list, os.path.join(input_dir, f'{name}.shp'),
+                projection_wkt, 'ESRI Shapefile',
+                fields={id_field: ogr.OFTInteger},
+                attribute_list=[
+                    {id_field: index + 1}
+                    for index in range(len(geometry_list))])
+
+        for name, table in (
+                ('biophysical',
+                 'lucode,Kc,root_depth,LULC_veg\n'
+                 '1,0.7,1500,1\n2,1.0,2500,1\n3,0.3,1,0\n'),
+                ('demand', 'lucode,demand\n1,0.5\n2,1.5\n3,10\n'),
+                ('valuation',
+                 'ws_id,efficiency,fraction,height,kw_price,cost,'
+                 'time_span,discount\n'
+                 '1,0.8,0.6,25,0.07,0,100,5\n'
+                 '2,0.9,0.5,40,0.07,1000,50,3\n')):
+            with open(os.path.join(input_dir, f'{name}.csv'), 'w') as file:
+                file.write(table)
+
+        # With a demand table, each of the 4 TaskGraph workers computes
+        # blocks in 2 worker processes of its own.
+        workspace_map = {}
+        for n_workers in (-1, 4):
+            workspace_map[n_workers] = os.path.join(
+                self.workspace_dir, f'workspace_{n_workers}')
+            hydropower_water_yield.execute({
+                'workspace_dir': workspace_map[n_workers],
+                'lulc_path': os.path.join(input_dir, 'lulc.tif'),
+                'depth_to_root_rest_layer_path': os.path.join(
+                    input_dir, 'depth.tif'),
+                'precipitation_path': os.path.join(input_dir, 'precip.tif'),
+                'pawc_path': os.path.join(input_dir, 'pawc.tif'),
+                'eto_path': os.path.join(input_dir, 'eto.tif'),
+                'watersheds_path': os.path.join(input_dir, 'watersheds.shp'),
+                'sub_watersheds_path': os.path.join(
+                    input_dir, 'subwatersheds.shp'),
+                'biophysical_table_path': os.path.join(
+                    input_dir, 'biophysical.csv'),
+                'demand_table_path': os.path.join(input_dir, 'demand.csv'),
+                'valuation_table_path': os.path.join(
+                    input_dir, 'valuation.csv'),
+                'seasonality_constant': 5,
+                'n_workers': n_workers,
+            })
+
+        for raster_path in (
+                os.path.join('output', 'per_pixel', 'aet.tif'),
+                os.path.join('output', 'per_pixel', 'fractp.tif'),
+                os.path.join('output', 'per_pixel', 'wyield.tif'),
+                os.path.join('intermediate', 'demand.tif')):
+            numpy.testing.assert_array_equal(
+                pygeoprocessing.raster_to_numpy_array(
+                    os.path.join(workspace_map[4], raster_path)),
+                pygeoprocessing.raster_to_numpy_array(
+                    os.path.join(workspace_map[-1], raster_path)))
+        for table_path in ('watershed_results_wyield.csv',
+                           'subwatershed_results_wyield.csv'):
+            pandas.testing.assert_frame_equal(
+                pandas.read_csv(
+                    os.path.join(workspace_map[4], 'output', table_path)),
+                pandas.read_csv(
+                    os.path.join(workspace_map[-1], 'output', table_path)))
+
+
+class HydropowerCoreTests(unittest.TestCase):
+    """Tests for the compiled Annual Water Yield kernels."""
+
+    # Landcover classes: vegetated, not vegetated, vegetated with Kc = 0,
+    # and nodata.
+    KC_LUT = numpy.array([0.9, 0.4, 0.0, -1], dtype=numpy.float32)
+    ROOT_LUT = numpy.array([2000.0, 1.0, 1500.0, -1], dtype=numpy.float32)
+    VEG_LUT = numpy.array([1, 0, 1, 255], dtype=numpy.uint8)
+    NODATA_DICT = {
+        'out_nodata': -1.0,
+        'eto': -9999.0,
+        'precip': -9999.0,
+        'depth_root': -9999.0,
+        'pawc': -9999.0,
+    }
+
+    @staticmethod
+    def make_fractp_inputs(float_type=numpy.float32, shape=(40, 50)):
+        """Make random landcover indexes and climate and soil inputs."""
+        rng = numpy.random.default_rng(seed=1)
+        lulc_index = rng.integers(0, 4, size=shape).astype(numpy.intp)
+        eto = (rng.random(shape) * 1500 + 200).astype(float_type)
+        precip = (rng.random(shape) * 2500 + 50).astype(float_type)
+        soil = (rng.random(shape) * 3000 + 100).astype(float_type)
+        pawc = (rng.random(shape) * 0.5).astype(float_type)
+        return lulc_index, eto, precip, soil, pawc
+
+    def calculate_fractp_and_pet(
+            self, lulc_index, eto, precip, soil, pawc, nodata_dict):
+        """Call the fractp kernel and the reference formulas."""
+        from natcap.invest.hydropower import hydropower_water_yield_core
+
+        seasonality_constant = 5.0
+        fractp = numpy.empty(lulc_index.shape, dtype=numpy.float32)
+        pet = numpy.empty(lulc_index.shape, dtype=numpy.float32)
+        hydropower_water_yield_core.calculate_fractp_and_pet(
+            lulc_index, self.KC_LUT, self.ROOT_LUT, self.VEG_LUT, eto,
+            precip, soil, pawc, nodata_dict['out_nodata'],
+            nodata_dict['eto'], nodata_dict['precip'],
+            nodata_dict['depth_root'], nodata_dict['pawc'],
+            seasonality_constant, fractp, pet)
+
+        # The landcover values as they used to be reclassified to rasters,
+        # with the inputs in double precision so that only the formulas
+        # are compared.
+        kc = self.KC_LUT[lulc_index].astype(numpy.float64)
+        root = self.ROOT_LUT[lulc_index].astype(numpy.float64)
+        veg = numpy.where(
+            self.VEG_LUT == hydropower_water_yield_core.VEG_NODATA,
+            nodata_dict['out_nodata'], self.VEG_LUT)[lulc_index]
+        eto, precip, soil, pawc = [
+            array.astype(numpy.float64) for array in (eto, precip, soil, pawc)]
+        expected_fractp = _reference_fractp_op(
+            kc, eto, precip, root, soil, pawc, veg, nodata_dict,
+            seasonality_constant)
+        expected_pet = _reference_pet_op(
+            eto, kc, nodata_dict['eto'], nodata_dict['out_nodata'])
+        return fractp, pet, expected_fractp, expected_pet
+
+    def assert_fractp_and_pet_equal(
+            self, fractp, pet, expected_fractp, expected_pet):
+        """Assert that the kernel results match the reference formulas."""
+        numpy.testing.assert_allclose(
+            fractp, expected_fractp, rtol=1e-6, atol=1e-7)
+        numpy.testing.assert_allclose(pet, expected_pet, rtol=1e-6)
+
+    def test_fractp_and_pet(self):
+        """Hydro: fractp and PET of vegetated and other landcover."""
+        lulc_index, eto, precip, soil, pawc = self.make_fractp_inputs()
+        fractp, pet, expected_fractp, expected_pet = (
+            self.calculate_fractp_and_pet(
+                lulc_index, eto, precip, soil, pawc, self.NODATA_DICT))
+        self.assert_fractp_and_pet_equal(
+            fractp, pet, expected_fractp, expected_pet)
+
+        # each branch was taken, as well as the nodata class
+        for lut_index in range(4):
+            self.assertTrue((lulc_index == lut_index).any())
+        nonveg_mask = lulc_index == 1
+        # the non-vegetated fraction is capped at 1
+        self.assertTrue((fractp[nonveg_mask] == 1).any())
+        self.assertTrue((fractp[nonveg_mask] < 1).any())
+        self.assertTrue((fractp[lulc_index == 3] == -1).all())
+        self.assertTrue((pet[lulc_index == 3] == -1).all())
+
+    def test_fractp_and_pet_zero_phi(self):
+        """Hydro: fractp where Kc or ETo is 0."""
+        lulc_index, eto, precip, soil, pawc = self.make_fractp_inputs()
+        eto[::3, ::2] = 0
+        fractp, pet, expected_fractp, expected_pet = (
+            self.calculate_fractp_and_pet(
+                lulc_index, eto, precip, soil, pawc, self.NODATA_DICT))
+        self.assert_fractp_and_pet_equal(
+            fractp, pet, expected_fractp, expected_pet)
+
+        zero_phi_mask = ((lulc_index == 2) | (eto == 0)) & (lulc_index != 3)
+        self.assertTrue(zero_phi_mask.any())
+        numpy.testing.assert_array_equal(fractp[zero_phi_mask], 0)
+
+    def test_fractp_and_pet_zero_precip(self):
+        """Hydro: fractp is nodata where there's no precipitation."""
+        lulc_index, eto, precip, soil, pawc = self.make_fractp_inputs()
+        precip[::2, ::3] = 0
+        fractp, pet, expected_fractp, expected_pet = (
+            self.calculate_fractp_and_pet(
+                lulc_index, eto, precip, soil, pawc, self.NODATA_DICT))
+        self.assert_fractp_and_pet_equal(
+            fractp, pet, expected_fractp, expected_pet)
+        numpy.testing.assert_array_equal(fractp[precip == 0], -1)
+
+    def test_fractp_and_pet_nodata(self):
+        """Hydro: fractp and PET with nodata in each input."""
+        for input_index, nodata_key in enumerate(
+                ('eto', 'precip', 'depth_root', 'pawc')):
+            inputs = list(self.make_fractp_inputs())
+            nodata_mask = numpy.zeros(inputs[0].shape, dtype=bool)
+            nodata_mask[1::4, ::3] = True
+            inputs[input_index + 1][nodata_mask] = -9999
+            fractp, pet, expected_fractp, expected_pet = (
+                self.calculate_fractp_and_pet(*inputs, self.NODATA_DICT))
+            self.assert_fractp_and_pet_equal(
+                fractp, pet, expected_fractp, expected_pet)
+            numpy.testing.assert_array_equal(fractp[nodata_mask], -1)
+            if nodata_key == 'eto':
+                numpy.testing.assert_array_equal(pet[nodata_mask], -1)
+
+        # Without nodata values, every pixel of a valid class has a value.
+        nodata_dict = dict.fromkeys(self.NODATA_DICT)
+        nodata_dict['out_nodata'] = -1.0
+        lulc_index, eto, precip, soil, pawc = self.make_fractp_inputs()
+        fractp, pet, expected_fractp, expected_pet = (
+            self.calculate_fractp_and_pet(
+                lulc_index, eto, precip, soil, pawc, nodata_dict))
+        self.assert_fractp_and_pet_equal(
+            fractp, pet, expected_fractp, expected_pet)
+        self.assertTrue((fractp[lulc_index != 3] >= 0).all())
+
+    def test_fractp_and_pet_float_types(self):
+        """Hydro: fractp and PET of float32 and float64 inputs."""
+        results = []
+        for float_type in (numpy.float32, numpy.float64):
+            lulc_index, eto, precip, soil, pawc = self.make_fractp_inputs(
+                float_type)
+            # a value that float32 can't represent
+            precip[0, 0] = 1000.0000001
+            fractp, pet, expected_fractp, expected_pet = (
+                self.calculate_fractp_and_pet(
+                    lulc_index, eto, precip, soil, pawc, self.NODATA_DICT))
+            self.assert_fractp_and_pet_equal(
+                fractp, pet, expected_fractp, expected_pet)
+            results.append((fractp, pet))
+        for float32_result, float64_result in zip(*results):
+            numpy.testing.assert_allclose(
+                float32_result, float64_result, rtol=1e-5)
+
+    def test_wyield_and_aet(self):
+        """Hydro: water yield and AET, with and without precip nodata."""
+        from natcap.invest.hydropower import hydropower_water_yield_core
+
+        rng = numpy.random.default_rng(seed=1)
+        shape = (40, 50)
+        fractp = rng.random(shape, dtype=numpy.float32)
+        fractp[::3, ::4] = -1
+        for float_type in (numpy.float32, numpy.float64):
+            precip = (rng.random(shape) * 2000).astype(float_type)
+            precip[1::5, ::2] = -9999
+            for precip_nodata in (-9999, None):
+                wyield = numpy.empty(shape, dtype=numpy.float32)
+                aet = numpy.empty(shape, dtype=numpy.float32)
+                hydropower_water_yield_core.calculate_wyield_and_aet(
+                    fractp, precip, precip_nodata, -1, wyield, aet)
+                numpy.testing.assert_allclose(
+                    wyield, _reference_wyield_op(
+                        fractp, precip, precip_nodata, -1), rtol=1e-6)
+                numpy.testing.assert_allclose(
+                    aet, _reference_aet_op(
+                        fractp, precip, precip_nodata, -1), rtol=1e-6)
+
+    def test_accumulate_zonal_stats(self):
+        """Hydro: per-zone statistics of a block."""
+        from natcap.invest.hydropower import hydropower_water_yield_core
+
+        rng = numpy.random.default_rng(seed=1)
+        zone_block = rng.integers(-1, 3, size=(20, 30), dtype=numpy.int32)
+        nodata = -9999.0
+        for value_type in (numpy.float32, numpy.float64):
+            value_block = rng.random((20, 30)).astype(value_type)
+            value_block[::4, ::3] = nodata
+            for value_nodata in (nodata, None):
+                count = numpy.zeros(3, dtype=numpy.int64)
+                nodata_count = numpy.zeros(3, dtype=numpy.int64)
+                value_sum = numpy.zeros(3, dtype=numpy.float64)
+                value_min = numpy.full(3, numpy.inf, dtype=numpy.float64)
+                value_max = numpy.full(3, -numpy.inf, dtype=numpy.float64)
+                hydropower_water_yield_core.accumulate_zonal_stats(
+                    zone_block, value_block, value_nodata, count,
+                    nodata_count, value_sum, value_min, value_max)
+
+                for zone in range(3):
+                    zone_values = value_block[zone_block == zone]
+                    if value_nodata is None:
+                        nodata_mask = numpy.zeros(
+                            zone_values.shape, dtype=bool)
+                    else:
+                        nodata_mask = numpy.isclose(zone_values, nodata)
+                    valid_values = zone_values[~nodata_mask]
+                    self.assertEqual(count[zone], valid_values.size)
+                    self.assertEqual(
+                        nodata_count[zone], numpy.count_nonzero(nodata_mask))
+                    numpy.testing.assert_allclose(
+                        value_sum[zone],
+                        numpy.sum(valid_values, dtype=numpy.float64))
+                    self.assertEqual(value_min[zone], valid_values.min())
+                    self.assertEqual(value_max[zone], valid_values.max())
@@ -398,3 +398,28 @@ class ReportingRegressionTests(unittest.TestCase):
         regression_str = regression_file.read()
 
         self.assertEqual(result_str, regression_str)
+
+    def test_extract_datasource_table_by_key(self):
+        """Reporting: test a vector's table is keyed case-insensitively."""
+        from natcap.invest import reporting
+        from osgeo import gdal, ogr
+
+        vector_path = os.path.join(self.workspace_dir, 'vector.shp')
+        driver = gdal.GetDriverByName('ESRI Shapefile')
+        vector = driver.Create(vector_path, 0, 0, 0, gdal.GDT_Unknown)
+        layer = vector.CreateLayer('vector', None, ogr.wkbPoint)
+        layer.CreateField(ogr.FieldDefn('WS_ID', ogr.OFTInteger))
+        layer.CreateField(ogr.FieldDefn('value', ogr.OFTReal))
+        for ws_id, value in ((1, 0.5), (2, 1.5)):
+            feature = ogr.Feature(layer.GetLayerDefn())
+            feature.SetField('WS_ID', ws_id)
+            feature.SetField('value', value)
+            feature.SetGeometry(ogr.CreateGeometryFromWkt('POINT (0 0)'))
+            layer.CreateFeature(feature)
+        feature = None
+        layer = None
+        vector = None
+
+        self.assertEqual(
+            reporting.extract_datasource_table_by_key(vector_path, 'ws_id'),
+            {1: {'WS_ID': 1, 'value': 0.5}, 2: {'WS_ID': 2, 'value': 1.5}})
@@ -1,5 +1,6 @@
 """Testing module for validation."""
 # encoding=UTF-8
+import collections
 import tempfile
 import unittest
 from unittest.mock import Mock
@@ -456,6 +457,53 @@ class RasterValidation(unittest.TestCase):
             filepath, projected=True, projection_units='m')
         self.assertTrue('must be projected in meters' in error_msg)
 
+    def test_raster_changed_on_disk(self):
+        """Validation: test a raster is revalidated after it changes."""
+        from natcap.invest import validation
+
+        driver = gdal.GetDriverByName('GTiff')
+        filepath = os.path.join(self.workspace_dir, 'raster.tif')
+        raster = driver.Create(filepath, 3, 3, 1, gdal.GDT_Int32)
+        wgs84_srs = osr.SpatialReference()
+        wgs84_srs.ImportFromEPSG(4326)
+        raster.SetProjection(wgs84_srs.ExportToWkt())
+        raster = None
+
+        error_msg = validation.check_raster(filepath, projected=True)
+        self.assertTrue('must be projected in linear units' in error_msg)
+
+        # Overwrite the raster with a projected one at the same path.
+        raster = driver.Create(filepath, 4, 4, 1, gdal.GDT_Int32)
+        meters_srs = osr.SpatialReference()
+        meters_srs.ImportFromEPSG(32731)
+        raster.SetProjection(meters_srs.ExportToWkt())
+        raster = None
+
+        self.assertEqual(
+            validation.check_raster(filepath, projected=True), None)
+
+    def test_uncached_datasets(self):
+        """Validation: test that VRTs and directories are not cached."""
+        from natcap.invest import validation
+
+        driver = gdal.GetDriverByName('GTiff')
+        raster_path = os.path.join(self.workspace_dir, 'raster.tif')
+        raster = driver.Create(raster_path, 3, 3, 1, gdal.GDT_Int32)
+        wgs84_srs = osr.SpatialReference()
+        wgs84_srs.ImportFromEPSG(4326)
+        raster.SetProjection(wgs84_srs.ExportToWkt())
+        raster.SetGeoTransform([0, 1, 0, 0, 0, -1])
+        raster = None
+        vrt_path = os.path.join(self.workspace_dir, 'raster.vrt')
+        vrt = gdal.BuildVRT(vrt_path, [raster_path])
+        vrt = None
+
+        self.assertNotEqual(validation._dataset_signature(raster_path), None)
+        self.assertEqual(validation._dataset_signature(vrt_path), None)
+        self.assertEqual(
+            validation._dataset_signature(self.workspace_dir), None)
+        self.assertEqual(validation.check_raster(vrt_path), None)
+
 
 class VectorValidation(unittest.TestCase):
     """Test Vector Validation."""
@@ -537,6 +585,82 @@ class VectorValidation(unittest.TestCase):
         self.assertEqual(None, validation.check_vector(
             filepath, projected=True, projection_units='m'))
 
+    def test_vector_prj_added(self):
+        """Validation: test a vector is revalidated after a .prj is added."""
+        from natcap.invest import validation
+
+        driver = gdal.GetDriverByName('ESRI Shapefile')
+        filepath = os.path.join(self.workspace_dir, 'vector.shp')
+        vector = driver.Create(filepath, 0, 0, 0, gdal.GDT_Unknown)
+        vector.CreateLayer('vector', None, ogr.wkbPoint)
+        vector = None
+        prj_path = os.path.join(self.workspace_dir, 'vector.prj')
+        self.assertFalse(os.path.exists(prj_path))
+
+        # The second call is answered from the cache, keyed on the files
+        # GDAL listed for the vector, which don't include a .prj.
+        for _ in range(2):
+            error_msg = validation.check_vector(filepath, projected=True)
+            self.assertTrue('must have a valid projection' in error_msg)
+
+        meters_srs = osr.SpatialReference()
+        meters_srs.ImportFromEPSG(32731)
+        meters_srs.MorphToESRI()
+        with open(prj_path, 'w') as prj:
+            prj.write(meters_srs.ExportToWkt())
+
+        self.assertEqual(
+            validation.check_vector(filepath, projected=True), None)
+
+    def test_dataset_file_lists_bounded(self):
+        """Validation: test only recent datasets' file lists are kept."""
+        from natcap.invest import validation
+
+        driver = gdal.GetDriverByName('GPKG')
+        filepath_list = []
+        for index in range(3):
+            filepath = os.path.join(self.workspace_dir, f'vector{index}.gpkg')
+            vector = driver.Create(filepath, 0, 0, 0, gdal.GDT_Unknown)
+            vector.CreateLayer('layer', None, ogr.wkbPoint)
+            vector = None
+            filepath_list.append(filepath)
+
+        dataset_file_lists = collections.OrderedDict()
+        with unittest.mock.patch.object(
+                validation, '_MAX_CACHED_DATASETS', 2), \
+                unittest.mock.patch.object(
+                    validation, '_DATASET_FILE_LISTS', dataset_file_lists):
+            for filepath in filepath_list:
+                validation.check_vector(filepath)
+
+        self.assertEqual(list(dataset_file_lists), filepath_list[1:])
+
+    def test_vector_sidecar_changed_on_disk(self):
+        """Validation: test a vector is revalidated after its .prj changes."""
+        from natcap.invest import validation
+
+        driver = gdal.GetDriverByName('ESRI Shapefile')
+        filepath = os.path.join(self.workspace_dir, 'vector.shp')
+        vector = driver.Create(filepath, 0, 0, 0, gdal.GDT_Unknown)
+        wgs84_srs = osr.SpatialReference()
+        wgs84_srs.ImportFromEPSG(4326)
+        vector.CreateLayer('vector', wgs84_srs, ogr.wkbPoint)
+        vector = None
+
+        for _ in range(2):
+            error_msg = validation.check_vector(filepath, projected=True)
+            self.assertTrue('must be projected in linear units' in error_msg)
+
+        # Only the .prj changes; the .shp is untouched.
+        meters_srs = osr.SpatialReference()
+        meters_srs.ImportFromEPSG(32731)
+        meters_srs.MorphToESRI()
+        with open(os.path.join(self.workspace_dir, 'vector.prj'), 'w') as prj:
+            prj.write(meters_srs.ExportToWkt())
+
+        self.assertEqual(
+            validation.check_vector(filepath, projected=True), None)
+
 
 class FreestyleStringValidation(unittest.TestCase):
     """Test Freestyle String Validation."""